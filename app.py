@@ -1,24 +1,340 @@
 import streamlit as st
 import random
 import json
+import os
+import hashlib
+import sys
+import tracemalloc
+import bisect
+import heapq
+import math
+from array import array
 import re
 import uuid
+import time
+import threading
 import httpx
 import html
-from datetime import datetime, timezone
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
 from zoneinfo import ZoneInfo
 from io import BytesIO
-from urllib.parse import urlparse, unquote
-from supabase import create_client
+from urllib.parse import urlparse, unquote, quote
+from supabase import create_client, ClientOptions
 from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+from streamlit.runtime.scriptrunner import add_script_run_ctx
+import streamlit.components.v1 as components
 import pdfplumber
 
+# =======================
+# 🌐 HTTP 전송 계층
+# - 모든 Supabase 호출(DB·Storage)이 프로세스 공용 httpx 클라이언트 하나를 함께 쓴다.
+#   keep-alive 커넥션 풀을 rerun·세션 사이에 재사용하고, h2 패키지가 있으면 HTTP/2로 연결한다.
+# - 조회(GET/HEAD)는 일시적 오류·지연 시 지터가 들어간 지수 백오프로 다시 시도한다.
+#   쓰기는 서버에 닿기 전 연결 실패일 때만 다시 시도해 중복 저장을 만들지 않는다.
+# - 서킷 브레이커가 "프로젝트가 잠듦/연결 불가"와 "요청 하나가 느림"을 구분한다.
+#   잠든 것으로 판단되면 잠시 동안 네트워크를 타지 않고 바로 실패시켜 화면이 멈추지 않게 한다.
+# =======================
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_KEEPALIVE = 10
+HTTP_RETRY_ATTEMPTS = 3
+HTTP_RETRY_BASE_DELAY = 0.2
+HTTP_RETRY_MAX_DELAY = 2.0
+HTTP_RETRY_BUDGET = 12.0  # 한 요청이 재시도까지 포함해 쓸 수 있는 최대 시간(초)
+HTTP_READ_TIMEOUT = httpx.Timeout(connect=5.0, read=15.0, write=15.0, pool=10.0)
+HTTP_UPLOAD_TIMEOUT = httpx.Timeout(connect=5.0, read=60.0, write=60.0, pool=10.0)
+_RETRYABLE_STATUS = {502, 503, 504, 520, 522, 524}
+_PAUSED_STATUS = {540}  # Supabase가 일시 중지된 프로젝트에 돌려주는 상태 코드
+
+
+class SupabaseUnavailable(Exception):
+    """재시도를 모두 소진했거나 서킷 브레이커가 열려 있어 요청을 보내지 않았을 때."""
+
+    def __init__(self, message, paused=False):
+        super().__init__(message)
+        self.paused = paused
+
+
+class CircuitBreaker:
+    """연속 실패를 세어 Supabase 상태를 ok / slow / degraded / paused 로 구분한다.
+    - 연결 자체가 안 되거나(연결 거부·DNS) 540 응답이면 잠든 것으로 보고 바로 연다.
+    - 시간 초과·5xx는 일시적인 지연으로 보고 SLOW_THRESHOLD번 연속될 때만 연다.
+    - 열린 뒤 COOLDOWN초가 지나면 요청 하나를 시험 삼아 통과시키고, 성공하면 닫는다.
+    """
+
+    SLOW_THRESHOLD = 5
+    COOLDOWN = 30.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.paused = False
+        self.last_error = None
+        self.last_slow_at = 0.0
+
+    def before_request(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.COOLDOWN:
+                raise SupabaseUnavailable(
+                    f"Supabase 연결 차단 중 (최근 오류: {self.last_error})", paused=self.paused
+                )
+            # 반쯤 열림: 이번 요청만 통과시키고 결과에 따라 닫거나 다시 연다.
+            self.opened_at = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.paused = False
+
+    def record_failure(self, error, paused=False):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if not paused:
+                self.last_slow_at = time.monotonic()
+            if paused or self.failures >= self.SLOW_THRESHOLD:
+                self.opened_at = time.monotonic()
+                self.paused = paused
+
+    def reset(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.paused = False
+
+    def health(self):
+        if self.opened_at is not None:
+            return "paused" if self.paused else "degraded"
+        if time.monotonic() - self.last_slow_at < self.COOLDOWN:
+            return "slow"
+        return "ok"
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ResilientTransport(httpx.BaseTransport):
+    """풀링된 HTTPTransport를 감싸 호출 종류별 timeout, 재시도, 서킷 브레이커를 적용한다."""
+
+    def __init__(self, breaker):
+        self.breaker = breaker
+        self._inner = httpx.HTTPTransport(
+            http2=_http2_available(),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=30.0,
+            ),
+        )
+
+    @staticmethod
+    def _timeout_for(request):
+        is_upload = "/storage/" in request.url.path and request.method in ("POST", "PUT")
+        timeout = HTTP_UPLOAD_TIMEOUT if is_upload else HTTP_READ_TIMEOUT
+        return {"connect": timeout.connect, "read": timeout.read, "write": timeout.write, "pool": timeout.pool}
+
+    def handle_request(self, request):
+        self.breaker.before_request()
+        request.extensions = {**request.extensions, "timeout": self._timeout_for(request)}
+        idempotent = request.method in ("GET", "HEAD")
+        deadline = time.monotonic() + HTTP_RETRY_BUDGET
+        attempt = 0
+        while True:
+            try:
+                response = self._inner.handle_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                error, paused = e, True
+            except httpx.TimeoutException as e:
+                if not idempotent:
+                    self.breaker.record_failure(e)
+                    raise
+                error, paused = e, False
+            else:
+                status = response.status_code
+                if status in _PAUSED_STATUS:
+                    error, paused = f"HTTP {status}", True
+                elif idempotent and status in _RETRYABLE_STATUS:
+                    error, paused = f"HTTP {status}", False
+                else:
+                    self.breaker.record_success()
+                    return response
+                response.read()
+                response.close()
+
+            attempt += 1
+            delay = random.uniform(0, min(HTTP_RETRY_MAX_DELAY, HTTP_RETRY_BASE_DELAY * 2 ** attempt))
+            if attempt >= HTTP_RETRY_ATTEMPTS or time.monotonic() + delay > deadline:
+                self.breaker.record_failure(error, paused=paused)
+                if isinstance(error, Exception):
+                    raise error
+                raise SupabaseUnavailable(f"Supabase 응답 오류 ({error})", paused=paused)
+            time.sleep(delay)
+
+    def close(self):
+        self._inner.close()
+
+
+@st.cache_resource(show_spinner=False)
+def circuit_breaker():
+    return CircuitBreaker()
+
+
+@st.cache_resource(show_spinner=False)
+def supabase_http():
+    """DB·Storage와 이미지 크기 확인이 함께 쓰는 풀링된 HTTP 클라이언트 (재시도·서킷 브레이커·계측 포함)."""
+    return httpx.Client(
+        transport=InstrumentedTransport(ResilientTransport(circuit_breaker()), call_metrics()),
+        timeout=HTTP_READ_TIMEOUT,
+        follow_redirects=True,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def _supabase_client(url: str, key: str):
+    return create_client(url, key, options=ClientOptions(httpx_client=supabase_http()))
+
+
+def supabase_health():
+    return circuit_breaker().health()
+
+# =======================
+# 📈 Supabase 호출 계측
+# - 전송 계층 맨 바깥에서 모든 DB·Storage 요청을 한 번씩 잰다. (재시도는 한 호출로 친다)
+# - 연산 키는 "호출한 함수 · 메서드 테이블/버킷" 이라서, 카드마다 따로 올리는 업로드 같은
+#   반복 호출(N+1)이 호출 횟수로 바로 드러난다.
+# - 통계는 프로세스 공용으로 모으고, 관리자 학습자에게만 카드 관리 화면에서 보여준다.
+# =======================
+CALL_LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000)
+_STORAGE_VERBS = {"list", "public", "authenticated", "sign", "move", "copy", "info"}
+
+
+def _call_resource(path: str) -> str:
+    """요청 경로를 테이블/RPC/버킷 단위 이름으로 줄인다. (파일 경로별로 키가 흩어지지 않게)"""
+    parts = [p for p in path.split("/") if p]
+    if parts[:2] == ["rest", "v1"]:
+        return "/".join(parts[2:4]) if parts[2:3] == ["rpc"] else "/".join(parts[2:3])
+    if parts[:2] == ["storage", "v1"]:
+        rest = parts[2:]
+        keep = 3 if len(rest) > 1 and rest[1] in _STORAGE_VERBS else 2
+        return "storage:" + "/".join(rest[1:keep])
+    return path
+
+
+def _call_site() -> str:
+    """이 요청을 일으킨 app.py 함수 이름. 스레드 풀에서 실행돼도 작업 함수 이름이 잡힌다."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename == __file__ and code.co_name != "handle_request":
+            return "(페이지)" if code.co_name == "<module>" else code.co_name
+        frame = frame.f_back
+    return "(알 수 없음)"
+
+
+class CallMetrics:
+    """연산별 호출 수, 실패 수, 지연 히스토그램, 주고받은 바이트를 누적한다."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now(timezone.utc)
+            self.ops = {}
+
+    def record(self, op, elapsed, sent, received, failed):
+        ms = elapsed * 1000
+        with self._lock:
+            m = self.ops.get(op)
+            if m is None:
+                m = self.ops[op] = {
+                    "count": 0, "failures": 0, "total_ms": 0.0, "max_ms": 0.0,
+                    "bytes_sent": 0, "bytes_received": 0,
+                    "histogram": [0] * (len(CALL_LATENCY_BUCKETS_MS) + 1),
+                }
+            m["count"] += 1
+            m["failures"] += int(failed)
+            m["total_ms"] += ms
+            m["max_ms"] = max(m["max_ms"], ms)
+            m["bytes_sent"] += sent
+            m["bytes_received"] += received
+            m["histogram"][bisect.bisect_left(CALL_LATENCY_BUCKETS_MS, ms)] += 1
+
+    def rows(self):
+        """호출 수가 많은 연산부터 정렬한 표 행 목록."""
+        labels = [f"≤{b}ms" for b in CALL_LATENCY_BUCKETS_MS] + [f">{CALL_LATENCY_BUCKETS_MS[-1]}ms"]
+        with self._lock:
+            items = [(op, dict(m, histogram=list(m["histogram"]))) for op, m in self.ops.items()]
+        out = []
+        for op, m in sorted(items, key=lambda kv: (-kv[1]["count"], kv[0])):
+            out.append({
+                "operation": op,
+                "count": m["count"],
+                "failure_rate": round(m["failures"] / m["count"], 3),
+                "avg_ms": round(m["total_ms"] / m["count"], 1),
+                "max_ms": round(m["max_ms"], 1),
+                "bytes_sent": m["bytes_sent"],
+                "bytes_received": m["bytes_received"],
+                "histogram": dict(zip(labels, m["histogram"])),
+            })
+        return out
+
+    def export(self):
+        return {
+            "started_at": self.started_at.isoformat(),
+            "exported_at": datetime.now(timezone.utc).isoformat(),
+            "latency_buckets_ms": list(CALL_LATENCY_BUCKETS_MS),
+            "operations": self.rows(),
+        }
+
+
+class InstrumentedTransport(httpx.BaseTransport):
+    """재시도 전송 계층을 감싸 호출 단위로 지연·크기·실패를 CallMetrics에 기록한다."""
+
+    def __init__(self, inner, metrics):
+        self._inner = inner
+        self.metrics = metrics
+
+    def handle_request(self, request):
+        op = f"{_call_site()} · {request.method} {_call_resource(request.url.path)}"
+        sent = int(request.headers.get("content-length") or 0)
+        started = time.perf_counter()
+        try:
+            response = self._inner.handle_request(request)
+            # 응답 본문까지 받아야 실제 크기와 전체 지연을 알 수 있다. (클라이언트도 어차피 전부 읽는다)
+            received = len(response.read())
+        except Exception:
+            self.metrics.record(op, time.perf_counter() - started, sent, 0, True)
+            raise
+        self.metrics.record(op, time.perf_counter() - started, sent, received, response.status_code >= 400)
+        return response
+
+    def close(self):
+        self._inner.close()
+
+
+@st.cache_resource(show_spinner=False)
+def call_metrics():
+    return CallMetrics()
+
 # =======================
 # Supabase 연결
 # =======================
 SUPABASE_URL = st.secrets["SUPABASE_URL"]
 SUPABASE_ANON_KEY = st.secrets["SUPABASE_ANON_KEY"]
-supabase = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+supabase = _supabase_client(SUPABASE_URL, SUPABASE_ANON_KEY)
 
 TABLE = "flashcard_app"
 PROGRESS_TABLE = "flashcard_progress"
@@ -85,11 +401,24 @@ _CATEGORY_PALETTE_DARK = [
     ("#831843", "#fbcfe8"), ("#1e3a8a", "#bfdbfe"), ("#134e4a", "#99f6e4"),
     ("#7f1d1d", "#fecaca"), ("#4c1d95", "#ddd6fe"),
 ]
+CATEGORY_COLOR_CACHE = 1024
+
+@st.cache_resource(show_spinner=False)
+def _category_colors():
+    return {}  # (카테고리, 다크 모드) → (배경색, 글자색)
+
 
 def category_color(cat: str):
-    palette = _CATEGORY_PALETTE_DARK if st.session_state.dark_mode else _CATEGORY_PALETTE_LIGHT
-    idx = sum(ord(ch) for ch in (cat or "")) % len(palette)
-    return palette[idx]
+    dark = bool(st.session_state.dark_mode)
+    colors = _category_colors()
+    color = colors.get((cat, dark))
+    if color is None:
+        palette = _CATEGORY_PALETTE_DARK if dark else _CATEGORY_PALETTE_LIGHT
+        color = palette[sum(ord(ch) for ch in (cat or "")) % len(palette)]
+        if len(colors) >= CATEGORY_COLOR_CACHE:
+            colors.clear()
+        colors[(cat, dark)] = color
+    return color
 
 _CSS_TEMPLATE = """
 <style>
@@ -244,6 +573,14 @@ div[role="radiogroup"] label:hover{
   white-space: pre-wrap;
 }
 
+.img-prefetch{
+  position: absolute;
+  width: 1px;
+  height: 1px;
+  opacity: 0;
+  pointer-events: none;
+}
+
 .stButton button{
   border-radius: 14px !important;
   padding: 10px 14px !important;
@@ -310,11 +647,172 @@ _css = (_CSS_TEMPLATE
 )
 st.markdown(_css, unsafe_allow_html=True)
 
+# =======================
+# 🧩 스키마 기능 확인
+# - 선택 설치 항목(학습자 테이블, updated_at 컬럼, tombstone·메타 테이블, RPC 함수)이 있는지
+#   시작 시 한 번에 병렬로 확인하고 프로세스 공용으로 SCHEMA_CAPABILITY_TTL초 동안 기억한다.
+# - 데이터 함수는 매번 조회하거나 예외로 알아내는 대신 has_capability()를 보고 빠른 경로를 고른다.
+# - 확인은 기능마다 따로 한다. 네트워크 오류·서킷 차단 등으로 확인하지 못한 기능은 "모름"으로
+#   SCHEMA_UNKNOWN_RETRY초 동안 기억하고, 그동안은 마지막으로 확인한 값(없으면 없음)을 쓴다.
+# =======================
+SCHEMA_CAPABILITY_TTL = 600
+SCHEMA_UNKNOWN_RETRY = 30
+_SCHEMA_MISSING_CODES = {"PGRST202", "PGRST204", "PGRST205", "42P01", "42703", "42883"}
+
+
+def _rpc_listed(name):
+    """PostgREST OpenAPI 목록(읽기 전용 GET)에 RPC가 있는지 본다. 데이터를 지우는 함수는 불러서 확인하지 않는다.
+    목록 공개가 꺼져 있어 거절되면 없는 것으로 본다(느린 경로로도 같은 일을 할 수 있는 선택 기능만 이렇게 확인)."""
+    rest = supabase.postgrest
+    res = rest.session.get(f"{str(rest.base_url).rstrip('/')}/", headers=rest.headers)
+    if res.status_code >= 400:
+        return False
+    return f"/rpc/{name}" in (res.json().get("paths") or {})
+
+
+def _schema_probes():
+    """기능 이름 → 그 기능이 있으면 성공하는(또는 True/False를 돌려주는) 가장 가벼운 읽기 요청.
+    증가 RPC는 빈 배열로 불러 아무것도 바꾸지 않는다."""
+    return {
+        "learners_table": lambda: supabase.table(LEARNERS_TABLE).select("learner").limit(1).execute(),
+        "progress_table": lambda: supabase.table(PROGRESS_TABLE).select("card_id").limit(1).execute(),
+        "cards_updated_at": lambda: supabase.table(TABLE).select("updated_at").limit(1).execute(),
+        "tombstones_table": lambda: supabase.table(CARD_TOMBSTONES_TABLE).select("card_id").limit(1).execute(),
+        "meta_table": lambda: supabase.table(META_TABLE).select("key").limit(1).execute(),
+        "progress_schedule": lambda: supabase.table(PROGRESS_TABLE).select("due_at").limit(1).execute(),
+        "review_events": lambda: supabase.table(REVIEW_EVENTS_TABLE).select("id").limit(1).execute(),
+        "daily_stats": lambda: supabase.table(DAILY_STATS_TABLE).select("day").limit(1).execute(),
+        "progress_rollup_view": lambda: supabase.table(PROGRESS_ROLLUP_VIEW).select("learner").limit(1).execute(),
+        CARD_INCREMENT_RPC: lambda: supabase.rpc(
+            CARD_INCREMENT_RPC, {"p_card_ids": [], "p_amounts": []}
+        ).execute(),
+        PROGRESS_INCREMENT_RPC: lambda: supabase.rpc(
+            PROGRESS_INCREMENT_RPC, {"p_learner": "", "p_card_ids": [], "p_amounts": [], "p_reviewed_at": []}
+        ).execute(),
+        PROGRESS_LEARNERS_RPC: lambda: supabase.rpc(PROGRESS_LEARNERS_RPC, {}).limit(0).execute(),
+        PROGRESS_DELETE_BY_CATEGORY_RPC: lambda: _rpc_listed(PROGRESS_DELETE_BY_CATEGORY_RPC),
+    }
+
+
+def _probe_capability(probe):
+    """True/False, 확인하지 못했으면 None. 예외를 올리지 않으므로 한 기능의 실패가 다른 기능에 번지지 않는다."""
+    try:
+        result = probe()
+        return result if isinstance(result, bool) else True
+    except APIError as e:
+        return False if e.code in _SCHEMA_MISSING_CODES else None
+    except Exception:
+        return None
+
+
+class SchemaCapabilities:
+    """기능별 확인 결과와 시각을 기억한다. 만료됐거나 아직 모르는 기능만 다시 확인한다."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        self._known = {}    # 이름 → (사용 가능 여부, 확인 시각)
+        self._unknown = {}  # 이름 → 마지막으로 확인에 실패한 시각
+
+    def _stale(self, names, now):
+        with self._lock:
+            return [
+                n for n in names
+                if (n not in self._known or now - self._known[n][1] >= SCHEMA_CAPABILITY_TTL)
+                and now - self._unknown.get(n, 0.0) >= SCHEMA_UNKNOWN_RETRY
+            ]
+
+    def get(self, name):
+        probes = _schema_probes()
+        if self._stale(probes, time.time()):
+            # 여러 세션이 동시에 만료를 발견해도 확인은 한 번만 한다.
+            with self._probe_lock:
+                stale = self._stale(probes, time.time())
+                if stale:
+                    with ThreadPoolExecutor(max_workers=len(stale)) as pool:
+                        results = dict(zip(stale, pool.map(_probe_capability, (probes[n] for n in stale))))
+                    now = time.time()
+                    with self._lock:
+                        for n, ok in results.items():
+                            if ok is None:
+                                self._unknown[n] = now  # 마지막으로 확인한 값은 그대로 둔다
+                            else:
+                                self._known[n] = (ok, now)
+                                self._unknown.pop(n, None)
+        with self._lock:
+            return self._known.get(name, (False, 0.0))[0]
+
+    def clear(self):
+        with self._lock:
+            self._known = {}
+            self._unknown = {}
+
+    def retry_unknown(self):
+        """연결이 돌아왔을 때 끊긴 동안 확인하지 못한 기능을 기다리지 않고 바로 다시 확인하게 한다."""
+        with self._lock:
+            self._unknown = {}
+
+
+@st.cache_resource(show_spinner=False)
+def schema_capabilities():
+    return SchemaCapabilities()
+
+
+def has_capability(name: str) -> bool:
+    return schema_capabilities().get(name)
+
+
+def refresh_schema_capabilities():
+    """SQL을 새로 실행한 뒤 등 설치 상태가 바뀌었을 때 다음 호출에서 다시 확인하게 한다."""
+    schema_capabilities().clear()
+
 # =======================
 # DB 유틸
 # =======================
+# PostgREST는 한 번의 응답을 서버 max-rows(기본 1000)로 잘라내므로 range() 창 단위로 나눠 받는다.
+CARD_PAGE_SIZE = 1000
+CARD_FETCH_WORKERS = 4
+
+
+def _count_cards():
+    res = supabase.table(TABLE).select("id", count="exact").limit(1).execute()
+    return res.count
+
+
+def _fetch_cards_window(start: int, end: int, columns="*"):
+    """[start, end] 구간을 가져온다. 서버 max-rows가 창보다 작아 잘려 오면 남은 부분을 이어서 받는다."""
+    rows = []
+    while start <= end:
+        page = (
+            supabase.table(TABLE).select(columns)
+            .order("created_at").order("id")
+            .range(start, end).execute().data or []
+        )
+        if not page:
+            break
+        rows.extend(page)
+        start += len(page)
+    return rows
+
+
+def fetch_cards_paginated(columns="*"):
+    """카드를 created_at 순 페이지로 나눠 제한된 스레드 풀에서 동시에 받아 순서대로 이어 붙인다.
+    (불러온 행, 조회 시점의 전체 행 수)를 반환한다. 조회 도중 추가된 카드는 다음 동기화 때 들어온다.
+    """
+    total = _count_cards() or 0
+    windows = [(start, min(start + CARD_PAGE_SIZE, total) - 1) for start in range(0, total, CARD_PAGE_SIZE)]
+    if len(windows) <= 1:
+        return [r for w in windows for r in _fetch_cards_window(*w, columns)], total
+
+    with ThreadPoolExecutor(max_workers=min(CARD_FETCH_WORKERS, len(windows))) as pool:
+        pages = pool.map(lambda w: _fetch_cards_window(*w, columns), windows)
+        rows = [r for page in pages for r in page]
+    return rows, total
+
+
 def fetch_cards():
-    return supabase.table(TABLE).select("*").order("created_at").execute().data or []
+    rows, _ = fetch_cards_paginated()
+    return rows
 
 def fetch_cards_safe():
     try:
@@ -322,17 +820,914 @@ def fetch_cards_safe():
     except (httpx.ConnectError, APIError, Exception):
         return None
 
+# =======================
+# 📇 컬럼 프로젝션
+# - 화면 대부분은 카테고리/앞면만 있으면 되므로 시작할 때는 가벼운 색인 컬럼만 받고,
+#   뒷면 텍스트와 이미지 URL은 실제로 보여줄 카드만 골라 나중에 채운다(hydrate).
+# - 백업·고아 이미지 검사처럼 전체 행이 필요한 곳은 계속 fetch_cards()를 쓴다.
+# =======================
+CARD_INDEX_COLUMNS = "id,category,front,created_at"
+CARD_DETAIL_COLUMNS = "id,back,front_image_url,back_image_url"
+CARD_DETAIL_CACHE_MAX = 5000  # 프로세스 전체에서 보관하는 상세 행 수 상한
+STUDY_HYDRATE_AHEAD = 10  # 암기 모드에서 미리 채워 두는 다음 카드 수
+
+
+def fetch_card_index():
+    # updated_at 컬럼이 없는 기존 설치는 증분 동기화 없이 색인 컬럼만 받는다.
+    columns = CARD_INDEX_COLUMNS + (",updated_at" if has_capability("cards_updated_at") else "")
+    rows, _ = fetch_cards_paginated(columns)
+    return rows
+
+def fetch_card_index_safe():
+    try:
+        return fetch_card_index()
+    except (httpx.ConnectError, APIError, Exception):
+        return None
+
+def fetch_card_details(card_ids):
+    """카드 id 목록의 뒷면/이미지 컬럼을 {id: row}로 가져온다."""
+    ids = [cid for cid in card_ids or [] if cid is not None]
+    details = {}
+    for i in range(0, len(ids), 200):
+        rows = supabase.table(TABLE).select(CARD_DETAIL_COLUMNS).in_("id", ids[i:i + 200]).execute().data or []
+        details.update((r["id"], r) for r in rows)
+    return details
+
+# =======================
 # ✅ 캐시(로딩 속도 개선 핵심)
-@st.cache_data(ttl=60, show_spinner=False)
-def cached_fetch_cards_safe():
-    return fetch_cards_safe()
+# - 카드 색인은 프로세스 전체가 함께 쓰는 저장소(CardStore) 하나에 "테이블 리비전"과 함께 보관한다.
+# - 리비전 = (이 프로세스의 쓰기 횟수, 카드 수, 가장 최근 updated_at/created_at).
+#   가벼운 조회로 리비전만 확인하고, 바뀌었을 때만 카드 색인을 다시 받는다.
+# - 쓰기 후에는 카드 캐시만 무효화하므로 다른 캐시 함수나 다른 학습자의 캐시는 그대로 남는다.
+# =======================
+CARD_REVISION_TTL = 15  # 리비전 확인 결과를 재사용하는 시간(초)
+
+
+@st.cache_data(ttl=CARD_REVISION_TTL, show_spinner=False)
+def _probe_cards_revision():
+    """(카드 수, 가장 최근 변경 시각). 조회 실패 시 None."""
+    # updated_at 컬럼이 없는 기존 설치: 수정은 이 프로세스의 쓰기 횟수로만 감지된다.
+    mark_col = "updated_at" if has_capability("cards_updated_at") else "created_at"
+    try:
+        res = supabase.table(TABLE).select(mark_col, count="exact").order(mark_col, desc=True).limit(1).execute()
+        mark = res.data[0].get(mark_col) if res.data else None
+        return res.count, mark
+    except Exception:
+        return None
+
+
+def _card_row_key(row):
+    """색인 행이 바뀌었는지 비교하는 값. 전체를 다시 받으면 행 dict가 모두 새로 만들어지므로 객체 대신 내용으로 본다.
+    updated_at이 있으면 뒷면·이미지만 바뀐 수정도 여기서 드러난다."""
+    return row.get("category"), row.get("front"), row.get("updated_at")
+
+
+class CardSnapshot:
+    """한 리비전의 카드 색인(읽기 전용). 모든 세션이 복사 없이 같은 객체를 참조한다.
+    id·카테고리 사전과 카테고리별 카드 수를 미리 만들어 두어 매 rerun마다 목록을 훑지 않는다.
+    rows/in_category()가 돌려주는 리스트와 행 dict는 공유 객체이므로 수정하지 않는다.
+    """
+
+    def __init__(self, rows, revision=None, hwm=None, full_load=False):
+        self.rows = rows  # created_at 순
+        self.revision = revision
+        self.hwm = hwm
+        self.full_load = full_load  # 증분 병합이 아니라 전체를 새로 받아 만든 스냅샷인지
+        self.by_id = {}
+        self.by_category = {}
+        for r in rows:
+            self.by_id[r.get("id")] = r
+            if r.get("category") is not None:
+                self.by_category.setdefault(r["category"], []).append(r)
+        self.category_counts = {cat: len(v) for cat, v in self.by_category.items()}
+        self.category_names = sorted(self.by_category)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def get(self, card_id):
+        return self.by_id.get(card_id)
+
+    def in_category(self, category):
+        return self.by_category.get(category, [])
+
+    def count(self, category):
+        return self.category_counts.get(category, 0)
+
+
+class CardStore:
+    """프로세스 공용 카드 저장소.
+    - 리비전이 바뀔 때만 새 CardSnapshot을 만든다. 가능하면 증분 동기화로 변경분만 받아 합친다.
+    - 여러 세션이 동시에 낡은 리비전을 발견해도 실제 조회는 잠금을 잡은 한 세션만 하고 나머지는 그 결과를 쓴다.
+    - 뒷면/이미지 같은 상세 컬럼도 세션마다 따로 받지 않고 여기서 함께 보관한다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._details_lock = threading.Lock()
+        self._local_writes = 0
+        self._full_synced_at = 0.0
+        self._reconciling = False
+        self._reconcile_again = False
+        self.snapshot = None
+        self._details = {}
+        self._offline_saved_at = 0.0
+        self._offline_writing = False
+        self._offline_again = False
+        self._offline_details = None  # 마지막으로 파일에 쓴 상세 내용 (프로세스에서 처음 쓸 때만 파일에서 읽는다)
+
+    def current_revision(self):
+        probe = _probe_cards_revision()
+        return None if probe is None else (self._local_writes, *probe)
+
+    def invalidate(self):
+        with self._details_lock:
+            self._local_writes += 1
+        _probe_cards_revision.clear()
+
+    def get(self, full=False):
+        """현재 리비전의 CardSnapshot. 새로 받아야 하는데 실패하면 None.
+        로컬 쓰기 직후 백그라운드 재확인이 도는 동안에는 기다리지 않고 지금 스냅샷을 돌려준다.
+        """
+        revision = self.current_revision()
+        snap = self.snapshot
+        if not full and snap is not None and (revision is None or revision == snap.revision or self._reconciling):
+            return snap
+        with self._lock:
+            # 잠금을 기다리는 동안 다른 세션이 이미 새 리비전을 받아 뒀을 수 있다.
+            snap = self.snapshot
+            if not full and snap is not None and revision == snap.revision:
+                return snap
+            loaded = self._load(snap, full)
+            if loaded is None:
+                return None
+            snap = self._install(loaded, revision)
+        self._save_offline(force=loaded[0] == "full")
+        return snap
+
+    def _load(self, snap, full=False):
+        """네트워크 조회만 하고 스냅샷은 건드리지 않는다. 가능하면 증분, 아니면 전체.
+        ("delta", (changed, deleted, hwm)) / ("full", rows), 실패하면 None.
+        """
+        if not full and snap is not None and snap.hwm and time.time() - self._full_synced_at < CARD_FULL_SYNC_EVERY:
+            changes = fetch_card_changes(snap.hwm)
+            if changes is not None:
+                return "delta", changes
+        rows = fetch_card_index_safe()
+        return None if rows is None else ("full", rows)
+
+    def _install(self, loaded, revision):
+        """잠금을 잡은 상태에서 _load 결과로 스냅샷을 바꾼다.
+        조회하는 동안 apply_local이 스냅샷을 바꿨을 수 있으므로 증분은 지금 스냅샷 위에 합친다.
+        """
+        kind, payload = loaded
+        if kind == "delta":
+            changed, deleted, new_hwm = payload
+            self._forget_details([r.get("id") for r in changed] + list(deleted))
+            base = self.snapshot or CardSnapshot([])
+            self.snapshot = CardSnapshot(merge_card_changes(base.rows, changed, deleted), revision, new_hwm)
+        else:
+            old = self.snapshot
+            self._full_synced_at = time.time()
+            self.snapshot = CardSnapshot(payload, revision, _cards_high_water_mark(payload), full_load=True)
+            # 받아 둔 상세 내용은 행이 바뀌었거나 사라진 카드 것만 버린다.
+            if old is None:
+                self._forget_details(None)
+            else:
+                new_by_id = self.snapshot.by_id
+                self._forget_details([
+                    cid for cid, r in old.by_id.items()
+                    if cid not in new_by_id or _card_row_key(new_by_id[cid]) != _card_row_key(r)
+                ])
+        return self.snapshot
+
+    def _save_offline(self, force=False):
+        """오프라인 학습용 로컬 스냅샷을 남긴다. 증분 변경은 OFFLINE_SNAPSHOT_EVERY초에 한 번만 쓴다.
+        직렬화와 파일 쓰기는 백그라운드 스레드 하나가 맡아 화면 재실행을 막지 않는다.
+        쓰는 도중에 또 요청되면 끝난 뒤 그때의 최신 상태로 한 번 더 쓴다.
+        """
+        if not force and time.time() - self._offline_saved_at < OFFLINE_SNAPSHOT_EVERY:
+            return
+        self._offline_saved_at = time.time()
+        with self._details_lock:
+            if self._offline_writing:
+                self._offline_again = True
+                return
+            self._offline_writing = True
+        thread = threading.Thread(target=self._write_offline, daemon=True)
+        add_script_run_ctx(thread)
+        thread.start()
+
+    def _write_offline(self):
+        while True:
+            try:
+                snap = self.snapshot
+                with self._details_lock:
+                    details = dict(self._details)
+                if self._offline_details is None:
+                    previous = load_offline_cards()
+                    self._offline_details = previous[1] if previous is not None else {}
+                # 캐시에서 밀려난 카드의 상세 내용은 지난번에 쓴 것을 이어받는다.
+                live_ids = snap.by_id
+                details = {**{k: v for k, v in self._offline_details.items() if k in live_ids}, **details}
+                if save_offline_cards(snap.rows, details):
+                    self._offline_details = details
+            except Exception:
+                pass
+            with self._details_lock:
+                if not self._offline_again:
+                    self._offline_writing = False
+                    return
+                self._offline_again = False
+
+    def seed_details(self, details):
+        """로컬 스냅샷의 상세 내용을 아직 받지 않은 카드에만 채운다. (오프라인 학습용)"""
+        with self._details_lock:
+            for cid, row in details.items():
+                self._details.setdefault(cid, row)
+
+    def cached_details(self, card_ids):
+        with self._details_lock:
+            return {cid: self._details[cid] for cid in card_ids or [] if cid in self._details}
+
+    def apply_local(self, changed=(), deleted_ids=()):
+        """쓰기 응답(returning=representation)으로 받은 행을 재조회 없이 곧바로 스냅샷에 반영한다.
+        다른 세션의 동시 쓰기 등으로 생길 수 있는 어긋남은 백그라운드 증분 동기화가 바로잡는다.
+        기준시각(hwm)은 그대로 두므로 그 재확인에서 방금 쓴 행도 다시 받아 서버 값으로 덮어쓴다.
+        """
+        index_keys = CARD_INDEX_COLUMNS.split(",") + ["updated_at"]
+        detail_keys = CARD_DETAIL_COLUMNS.split(",")
+        index_rows = [{k: r[k] for k in index_keys if k in r} for r in changed or []]
+        with self._lock:
+            snap = self.snapshot or CardSnapshot([])
+            self.snapshot = CardSnapshot(
+                merge_card_changes(snap.rows, index_rows, {cid: None for cid in deleted_ids or []}),
+                snap.revision, snap.hwm,
+            )
+        self._forget_details(list(deleted_ids or []))
+        with self._details_lock:
+            for r in changed or []:
+                self._details[r.get("id")] = {k: r.get(k) for k in detail_keys}
+        self.invalidate()
+        self._start_reconcile()
+
+    def _start_reconcile(self):
+        with self._details_lock:
+            if self._reconciling:
+                self._reconcile_again = True
+                return
+            self._reconciling = True
+        thread = threading.Thread(target=self._reconcile, daemon=True)
+        add_script_run_ctx(thread)
+        thread.start()
+
+    def _reconcile(self):
+        # 네트워크 조회는 잠금 밖에서 한다. 그동안의 쓰기(apply_local)와 화면 조회(get)를 막지 않고,
+        # 잠금은 받은 결과로 스냅샷을 바꿀 때만 잡는다.
+        while True:
+            try:
+                revision = self.current_revision()
+                snap = self.snapshot
+                if snap is None or revision != snap.revision:
+                    loaded = self._load(snap)
+                    if loaded is not None:
+                        with self._lock:
+                            self._install(loaded, revision)
+                        self._save_offline(force=loaded[0] == "full")
+            except Exception:
+                pass
+            with self._details_lock:
+                if not self._reconcile_again:
+                    self._reconciling = False
+                    return
+                self._reconcile_again = False
+
+    def details(self, card_ids):
+        """요청한 카드의 상세 컬럼 {id: row}. 아직 없는 것만 한 번에 받아 채운다."""
+        ids = [cid for cid in dict.fromkeys(card_ids or []) if cid is not None]
+        with self._details_lock:
+            missing = [cid for cid in ids if cid not in self._details]
+        if missing:
+            fetched = fetch_card_details(missing)
+            with self._details_lock:
+                self._details.update(fetched)
+                # 오래 전에 받은 카드부터 버려 메모리를 일정하게 유지한다. 방금 요청한 카드는 남긴다.
+                requested = set(ids)
+                for cid in list(self._details):
+                    if len(self._details) <= CARD_DETAIL_CACHE_MAX:
+                        break
+                    if cid not in requested:
+                        del self._details[cid]
+            if self.snapshot is not None:
+                self._save_offline()
+        with self._details_lock:
+            return {cid: self._details[cid] for cid in ids if cid in self._details}
+
+    def detail(self, card_id):
+        return self._details.get(card_id)
+
+    def _forget_details(self, card_ids):
+        with self._details_lock:
+            if card_ids is None:
+                self._details = {}
+            for cid in card_ids or []:
+                self._details.pop(cid, None)
+
+
+@st.cache_resource(show_spinner=False)
+def card_store():
+    return CardStore()
+
 
 def clear_cards_cache():
+    """카드 데이터 캐시만 무효화한다. 다른 세션은 다음 리비전 확인 때 새 데이터를 받아 간다."""
     try:
-        st.cache_data.clear()
+        card_store().invalidate()
     except Exception:
         pass
 
+# =======================
+# 🔁 증분 동기화 (변경분만 받아오기)
+# - flashcard_app.updated_at(수정 시 now()로 갱신되는 컬럼)보다 새로운 행만 받아오고,
+#   삭제된 카드는 flashcard_app_tombstones(card_id, deleted_at)에 남긴 기록으로 반영한다.
+# - 두 가지 중 하나라도 없는 기존 설치에서는 자동으로 전체 동기화로 폴백한다.
+#
+#   alter table flashcard_app add column if not exists updated_at timestamptz default now();
+#   create table if not exists flashcard_app_tombstones (
+#     card_id bigint primary key, deleted_at timestamptz not null default now());
+#   -- updated_at 은 update 트리거(moddatetime 등)로 갱신
+# =======================
+CARD_TOMBSTONES_TABLE = "flashcard_app_tombstones"
+CARD_FULL_SYNC_EVERY = 600  # 증분 동기화 중에도 10분마다 한 번은 전체를 받아 어긋남을 바로잡는다
+
+
+def _cards_high_water_mark(rows):
+    """받아온 카드 중 가장 최근 updated_at. updated_at 컬럼이 없으면 None."""
+    marks = [r.get("updated_at") for r in rows or [] if r.get("updated_at")]
+    return max(marks) if marks else None
+
+
+def _fetch_since_pages(table, columns, mark_col, id_col, since):
+    """mark_col >= since인 행을 (mark_col, id_col) 순 페이지로 끝까지 받는다.
+    서버 max-rows에 잘린 변경분이 기준시각 뒤로 밀려 영영 빠지는 일이 없도록 빈 페이지가 올 때까지 이어 받는다.
+    """
+    rows, start = [], 0
+    while True:
+        page = (
+            supabase.table(table).select(columns)
+            .gte(mark_col, since).order(mark_col).order(id_col)
+            .range(start, start + CARD_PAGE_SIZE - 1).execute().data or []
+        )
+        if not page:
+            return rows
+        rows.extend(page)
+        start += len(page)
+
+
+def fetch_card_changes(since: str):
+    """since 이후 바뀐 카드 행과 삭제 기록을 (changed, {card_id: deleted_at}, 새 기준시각)으로 반환한다.
+    updated_at 컬럼이나 tombstone 테이블이 없어 증분 조회를 할 수 없으면 None.
+    기준시각과 같은 시각의 행도 다시 받아(gte) 같은 순간의 커밋을 놓치지 않으며, 병합은 id 기준이라 중복돼도 안전하다.
+    """
+    if not (has_capability("cards_updated_at") and has_capability("tombstones_table")):
+        return None
+    try:
+        changed = _fetch_since_pages(TABLE, CARD_INDEX_COLUMNS + ",updated_at", "updated_at", "id", since)
+        tombstones = _fetch_since_pages(CARD_TOMBSTONES_TABLE, "card_id,deleted_at", "deleted_at", "card_id", since)
+    except Exception:
+        return None
+
+    deleted = {r["card_id"]: r.get("deleted_at") or "" for r in tombstones if r.get("card_id") is not None}
+    marks = [since]
+    marks += [r["updated_at"] for r in changed if r.get("updated_at")]
+    marks += [d for d in deleted.values() if d]
+    return changed, deleted, max(marks)
+
+
+def merge_card_changes(cards, changed, deleted):
+    """기존 카드 목록에 변경분을 id 기준으로 합친다. created_at 순서는 그대로 유지한다.
+    삭제 이후 같은 id로 다시 들어온 카드(백업 복구 등)는 updated_at이 더 늦으므로 살려 둔다.
+    deleted의 값이 None이면(이 세션이 방금 지운 카드) 시각과 관계없이 지운다.
+    """
+    if not changed and not deleted:
+        return cards
+    by_id = {c.get("id"): c for c in cards}
+    for row in changed or []:
+        by_id[row.get("id")] = row
+    for cid, deleted_at in (deleted or {}).items():
+        row = by_id.get(cid)
+        if row is not None and (deleted_at is None or (row.get("updated_at") or "") <= deleted_at):
+            del by_id[cid]
+    merged = list(by_id.values())
+    merged.sort(key=lambda c: (c.get("created_at") or "", c.get("id") or 0))
+    return merged
+
+
+def record_card_tombstones(card_ids):
+    """삭제한 카드 id를 다른 세션의 증분 동기화가 알 수 있도록 남긴다. 테이블이 없으면 조용히 넘어간다."""
+    ids = [cid for cid in card_ids or [] if cid is not None]
+    if not ids or not has_capability("tombstones_table"):
+        return True
+    # deleted_at은 DB 기본값(now())에 맡긴다. 클라이언트 시계가 어긋나도 기준시각이 앞서 나가지 않게 하기 위함.
+    try:
+        for i in range(0, len(ids), 200):
+            supabase.table(CARD_TOMBSTONES_TABLE).upsert(
+                [{"card_id": cid} for cid in ids[i:i + 200]],
+                on_conflict="card_id",
+            ).execute()
+        return True
+    except Exception:
+        return False
+
+# =======================
+# 🔎 카드 검색 색인
+# - 앞면/뒷면을 공백 토큰과 토큰 안의 글자 2-gram으로 나눈 역색인을 프로세스 전체가 함께 쓴다.
+#   한글은 음절 하나가 한 글자이므로 2-gram이면 조사가 붙은 말("오스테나이트는")도 부분 문자열로 찾힌다.
+# - 카드 스냅샷이 바뀌면 행 객체가 달라진 카드만 다시 색인한다. 스냅샷은 읽기 전용이라 `is` 비교로 충분하다.
+# - 문서 번호는 늘어나기만 하므로 포스팅 목록(array)은 항상 정렬된 채 뒤에 붙이기만 하고,
+#   지운 문서는 번호만 기록해 두었다가 일정 비율이 넘으면 한꺼번에 걸러낸다.
+# - 뒷면은 스냅샷에 없으므로 상세 캐시에서 가져오고, 없는 것만 받아 온다. 받지 못한 카드는 앞면만 색인해 두고 나중에 다시 채운다.
+# - 색인할 때 초성 문자열("ㅇㅅㅌㄴㅇㅌ")과 자모 문자열도 함께 만들어 두고 초성 2-gram도 포스팅에 넣는다.
+#   초성만 입력한 질의는 초성 문자열에서, 입력 중인 마지막 글자("오스텐")는 자모 문자열에서 찾는다.
+# - 순위는 BM25(앞면 가중치를 더 준 필드별 합산). 문서 길이는 글자 수로 정규화하고,
+#   df는 토큰의 필수 키 중 가장 짧은 포스팅 길이(상한)로 어림한다. limit가 있으면 크기 limit인 힙만 유지한다.
+# =======================
+SEARCH_COMPACT_MIN = 2000  # 지운 문서가 이만큼(그리고 살아 있는 문서의 1/4) 넘게 쌓이면 포스팅을 정리한다
+SEARCH_BACKFILL_RETRY = 30  # 뒷면을 받지 못한 카드를 다시 받아 보는 간격(초)
+SEARCH_RESULT_CACHE = 64  # 카드를 넘길 때마다 같은 검색이 다시 돌지 않도록 보관하는 최근 결과 수
+SEARCH_EVERYWHERE_LIMIT = 10  # 전체 검색 상자에 보여 주는 결과 수
+SEARCH_SCORE_CAP = 2000  # 넓은 질의(한 글자 등)에서 BM25로 채점하는 최대 후보 수
+BM25_K1 = 1.2
+BM25_B = 0.75
+BM25_FRONT_BOOST = 2.0  # 앞면(개념 이름)에서 찾은 것을 뒷면(설명)보다 크게 친다
+BM25_BACK_BOOST = 1.0
+SEARCH_FUZZY_WEIGHT = 0.5  # 자모 단위로만 맞은(입력 중인 글자) 횟수에 주는 가중치
+SEARCH_WHOLE_TOKEN_BOOST = 1.2  # 공백 토큰과 통째로 같은 토큰의 점수 배율
+_SEARCH_TOKEN = "\x01"  # 2-gram과 겹치지 않도록 공백 토큰 키 앞에 붙이는 표시
+_SEARCH_CHOSEONG = "\x02"  # 초성 2-gram 키 앞에 붙이는 표시
+_CHOSEONG = "ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ"
+_JUNGSEONG = "ㅏㅐㅑㅒㅓㅔㅕㅖㅗㅘㅙㅚㅛㅜㅝㅞㅟㅠㅡㅢㅣ"
+_JONGSEONG = ("", *"ㄱㄲㄳㄴㄵㄶㄷㄹㄺㄻㄼㄽㄾㄿㅀㅁㅂㅄㅅㅆㅇㅈㅊㅋㅌㅍㅎ")
+# 겹받침/겹모음은 낱자로 풀어 둔다. "달ㄱ"처럼 입력 중인 글자도 "닭"의 자모와 맞도록 하기 위함.
+_JAMO_SPLIT = {
+    "ㄳ": "ㄱㅅ", "ㄵ": "ㄴㅈ", "ㄶ": "ㄴㅎ", "ㄺ": "ㄹㄱ", "ㄻ": "ㄹㅁ", "ㄼ": "ㄹㅂ", "ㄽ": "ㄹㅅ",
+    "ㄾ": "ㄹㅌ", "ㄿ": "ㄹㅍ", "ㅀ": "ㄹㅎ", "ㅄ": "ㅂㅅ",
+    "ㅘ": "ㅗㅏ", "ㅙ": "ㅗㅐ", "ㅚ": "ㅗㅣ", "ㅝ": "ㅜㅓ", "ㅞ": "ㅜㅔ", "ㅟ": "ㅜㅣ", "ㅢ": "ㅡㅣ",
+}
+_CHOSEONG_TABLE = {0xAC00 + i: _CHOSEONG[i // 588] for i in range(11172)}
+_JAMO_TABLE = {
+    **{ord(k): v for k, v in _JAMO_SPLIT.items()},
+    **{
+        0xAC00 + i: (_CHOSEONG[i // 588] + _JUNGSEONG[i // 28 % 21] + _JONGSEONG[i % 28]).translate(
+            {ord(k): v for k, v in _JAMO_SPLIT.items()}
+        )
+        for i in range(11172)
+    },
+}
+
+
+def search_normalize(text):
+    """NFC 정규화(맥에서 입력한 자모 분리형 포함) + 소문자."""
+    return unicodedata.normalize("NFC", text or "").lower()
+
+
+def hangul_choseong(text):
+    """한글 음절을 초성으로 바꾼다. 나머지 글자는 그대로 두므로 길이와 공백 위치가 같다."""
+    return text.translate(_CHOSEONG_TABLE)
+
+
+def hangul_jamo(text):
+    """한글 음절과 겹자모를 낱자 자모로 푼다."""
+    return text.translate(_JAMO_TABLE)
+
+
+def _is_hangul_syllable(ch):
+    return "가" <= ch <= "힣"
+
+
+def _is_hangul_jamo(ch):
+    return "ㄱ" <= ch <= "ㅣ"
+
+
+def _bigrams(text):
+    return map(str.__add__, text, text[1:])
+
+
+def _search_grams(text, choseong):
+    grams = set()
+    for tok, cho in zip(text.split(), choseong.split()):
+        grams.add(_SEARCH_TOKEN + tok)
+        grams.update(_bigrams(tok))
+        if cho != tok:
+            grams.update(map(_SEARCH_CHOSEONG.__add__, _bigrams(cho)))
+    return grams
+
+
+def _query_token_kind(tok):
+    """'choseong'(초성만), 'jamo'(한글 포함: 마지막 글자가 입력 중일 수 있음), 'plain'."""
+    if all("ㄱ" <= ch <= "ㅎ" for ch in tok):
+        return "choseong"
+    if any(_is_hangul_syllable(ch) or _is_hangul_jamo(ch) for ch in tok):
+        return "jamo"
+    return "plain"
+
+
+def _query_grams(tok, kind):
+    """이 토큰과 맞는 문서라면 반드시 가지고 있는 포스팅 키."""
+    if kind == "choseong":
+        return set(map(_SEARCH_CHOSEONG.__add__, _bigrams(tok)))
+    n = 0
+    while n < len(tok) and _is_hangul_syllable(tok[n]):
+        n += 1
+    if kind == "plain" or (n < len(tok) and not _is_hangul_jamo(tok[n])):
+        return set(_bigrams(tok))
+    # 앞쪽의 완성된 음절만 믿는다. 마지막 음절은 받침이 다음 글자의 초성일 수 있으므로 초성만 쓴다.
+    lead = tok[:n]
+    grams = set(_bigrams(lead[:-1]))
+    grams.update(map(_SEARCH_CHOSEONG.__add__, _bigrams(hangul_choseong(lead))))
+    return grams
+
+
+def _sorted_contains(posting, doc):
+    i = bisect.bisect_left(posting, doc)
+    return i < len(posting) and posting[i] == doc
+
+
+def _token_tf(entry, tok, kind, tok_jamo):
+    """문서 한 개에서 질의 토큰이 나온 횟수 (앞면, 뒷면). 자모 단위로만 맞은 횟수는 가중치를 낮춘다."""
+    _, _, front, back, front_cho, back_cho, front_jamo, back_jamo = entry
+    if kind == "choseong":
+        return front_cho.count(tok), back_cho.count(tok)
+    front_tf, back_tf = front.count(tok), back.count(tok)
+    if tok_jamo is not None:
+        front_tf += max(front_jamo.count(tok_jamo) - front_tf, 0) * SEARCH_FUZZY_WEIGHT
+        back_tf += max(back_jamo.count(tok_jamo) - back_tf, 0) * SEARCH_FUZZY_WEIGHT
+    return front_tf, back_tf
+
+
+class CardSearchIndex:
+    """카드 앞면/뒷면 역색인. sync()로 스냅샷과 맞춘 뒤 search()로 찾는다."""
+
+    # sync()가 새로 만든 색인에서 통째로 바꿔 끼우는 상태
+    _STATE = ("_docs", "_docnum", "_postings", "_by_category", "_front_chars", "_back_chars", "_dead", "_missing_back")
+
+    def __init__(self):
+        self._lock = threading.Lock()  # 검색과 바꿔 끼우기
+        self._build_lock = threading.Lock()  # 색인 만들기는 한 번에 한 세션만
+        self._snap = None
+        self._rows = {}  # card_id → 색인에 반영한 스냅샷 행 (변경 감지용)
+        self._docs = []  # 문서 번호 → (card_id, category, 앞면, 뒷면, 앞면 초성, 뒷면 초성, 앞면 자모, 뒷면 자모) / 지운 문서는 None
+        self._docnum = {}  # card_id → 문서 번호
+        self._postings = {}  # gram → array("i") 문서 번호(오름차순)
+        self._by_category = {}  # 카테고리 → 문서 번호 집합
+        self._front_chars = 0  # 살아 있는 문서의 앞면/뒷면 글자 수 합 (BM25 평균 길이용)
+        self._back_chars = 0
+        self._dead = set()
+        self._missing_back = set()
+        self._backfill_at = 0.0
+        self._results = {}  # (토큰, 카테고리, limit) → 결과. 색인이 바뀌면 비운다.
+        self._touched = set()  # 행 내용과 관계없이 다시 색인할 카드 (뒷면만 고친 경우 등)
+        self._impact = None  # _impact_order() 결과. 색인이 바뀌면 다시 만든다.
+
+    def __len__(self):
+        return len(self._docnum)
+
+    def touch(self, card_ids):
+        """다음 sync()에서 다시 색인하게 한다. 색인 행으로는 드러나지 않는 뒷면 수정 뒤에 부른다."""
+        with self._lock:
+            self._touched.update(card_ids)
+            self._snap = None
+
+    def sync(self, snap, fetch=True):
+        """스냅샷과 색인을 맞춘다. fetch=False(오프라인)면 뒷면을 받아 오지 않고 캐시에 있는 것만 쓴다.
+        뒷면 조회와 새 포스팅 계산은 검색 잠금(_lock) 밖에서 하고 마지막에 바꿔 끼우므로,
+        색인을 만드는 동안에도 다른 세션은 기존 색인으로 검색한다. 만드는 일은 _build_lock을 잡은 한 세션만 하고,
+        이미 누가 만들고 있으면 기존 색인이 있는 한 기다리지 않고 돌아간다(다음 실행에서 다시 맞춘다).
+        """
+        retry = fetch and self._missing_back and time.time() - self._backfill_at >= SEARCH_BACKFILL_RETRY
+        if snap is self._snap and not retry:
+            return
+        if not self._build_lock.acquire(blocking=not self._docnum):
+            return
+        try:
+            if snap is not self._snap:
+                self._sync_snapshot(snap, fetch)
+            elif retry:
+                ids = list(self._missing_back)
+                backs = self._backs(ids, fetch)
+                entries = [self._entry(self._rows[cid], backs[cid]) for cid in ids if cid in backs and cid in self._rows]
+                with self._lock:
+                    for entry in entries:
+                        self._remove(entry[0][0])
+                        self._add(*entry)
+                    self._results = {}
+                    self._impact = None
+            if len(self._dead) > max(SEARCH_COMPACT_MIN, len(self._docnum) // 4):
+                postings = self._compacted()
+                with self._lock:
+                    self._postings = postings
+                    self._dead = set()
+        finally:
+            self._build_lock.release()
+
+    def _sync_snapshot(self, snap, fetch):
+        # 전체를 다시 받은 스냅샷도 내용이 같은 행은 다시 색인하지 않는다.
+        with self._lock:
+            touched, self._touched = self._touched, set()
+        old_rows = self._rows
+        changed = []
+        for r in snap.rows:
+            cid = r.get("id")
+            if cid is None:
+                continue
+            old = old_rows.get(cid)
+            if old is None or cid in touched or (old is not r and _card_row_key(old) != _card_row_key(r)):
+                changed.append(r)
+        removed = old_rows.keys() - snap.by_id.keys()
+        backs = self._backs([r["id"] for r in changed], fetch)
+        entries = [self._entry(r, backs.get(r["id"])) for r in changed]
+        if len(entries) > max(SEARCH_COMPACT_MIN, len(self._docnum) // 4):
+            # 많이 바뀌었으면(첫 색인 포함) 새 색인을 따로 만들어 통째로 바꿔 끼운다.
+            fresh = CardSearchIndex()
+            changed_ids = {entry[0][0] for entry in entries}
+            for entry in self._docs:
+                if entry is not None and entry[0] not in changed_ids and entry[0] not in removed:
+                    fresh._add(entry, self._entry_grams(entry), entry[0] in self._missing_back)
+            for entry in entries:
+                fresh._add(*entry)
+            with self._lock:
+                for name in self._STATE:
+                    setattr(self, name, getattr(fresh, name))
+                self._finish_sync(snap)
+        else:
+            with self._lock:
+                for cid in removed:
+                    self._remove(cid)
+                    self._missing_back.discard(cid)
+                for entry in entries:
+                    self._remove(entry[0][0])
+                    self._add(*entry)
+                self._finish_sync(snap)
+
+    def _finish_sync(self, snap):
+        # _lock 안에서 부른다. 만드는 동안 touch()가 있었으면 다음 sync()에서 다시 맞춘다.
+        self._rows = snap.by_id
+        self._snap = None if self._touched else snap
+        self._results = {}
+        self._impact = None
+
+    def _backs(self, card_ids, fetch):
+        """{card_id: 뒷면}. 상세 캐시에 없는 카드만 받아 오고, 받지 못한 카드는 빠진다."""
+        backs = {cid: d.get("back") or "" for cid, d in card_store().cached_details(card_ids).items()}
+        missing = [cid for cid in card_ids if cid not in backs]
+        if missing and fetch:
+            self._backfill_at = time.time()
+            try:
+                if len(missing) > CARD_PAGE_SIZE:
+                    rows, _ = fetch_cards_paginated("id,back")
+                else:
+                    rows = fetch_card_details(missing).values()
+                wanted = set(missing)
+                backs.update((r["id"], r.get("back") or "") for r in rows if r.get("id") in wanted)
+            except Exception:
+                pass
+        return backs
+
+    @staticmethod
+    def _entry(row, back):
+        """(문서 항목, 포스팅 키 집합, 뒷면을 못 받았는지). 잠금 없이 미리 계산해 둔다."""
+        front = search_normalize(row.get("front"))
+        back_text = search_normalize(back)
+        front_cho, back_cho = hangul_choseong(front), hangul_choseong(back_text)
+        entry = (
+            row["id"], row.get("category"), front, back_text,
+            front_cho, back_cho, hangul_jamo(front), hangul_jamo(back_text),
+        )
+        return entry, CardSearchIndex._entry_grams(entry), back is None
+
+    @staticmethod
+    def _entry_grams(entry):
+        return _search_grams(entry[2], entry[4]) | _search_grams(entry[3], entry[5])
+
+    def _add(self, entry, grams, missing_back):
+        cid = entry[0]
+        doc = len(self._docs)
+        self._docs.append(entry)
+        self._docnum[cid] = doc
+        self._by_category.setdefault(entry[1], set()).add(doc)
+        self._front_chars += len(entry[2])
+        self._back_chars += len(entry[3])
+        postings = self._postings
+        for gram in grams:
+            try:
+                postings[gram].append(doc)
+            except KeyError:
+                postings[gram] = array("i", (doc,))
+        if missing_back:
+            self._missing_back.add(cid)
+        else:
+            self._missing_back.discard(cid)
+
+    def _remove(self, card_id):
+        doc = self._docnum.pop(card_id, None)
+        if doc is not None:
+            entry = self._docs[doc]
+            self._by_category.get(entry[1], set()).discard(doc)
+            self._front_chars -= len(entry[2])
+            self._back_chars -= len(entry[3])
+            self._docs[doc] = None
+            self._dead.add(doc)
+
+    def _compacted(self):
+        """지운 문서를 뺀 새 포스팅. _build_lock만 잡고 만들어 _lock 안에서 바꿔 끼운다."""
+        dead = self._dead
+        postings = {}
+        for gram, posting in self._postings.items():
+            kept = array("i", (d for d in posting if d not in dead))
+            if kept:
+                postings[gram] = kept
+        return postings
+
+    def _candidates(self, tokens, within=None):
+        """모든 토큰의 필수 키(2-gram/초성 2-gram)를 가진 문서 번호 집합(within이 있으면 그 안에서만).
+        키가 없는(한 글자) 질의면 within, 그것도 없으면 살아 있는 모든 문서.
+        """
+        grams = set()
+        for tok, kind in tokens:
+            grams.update(_query_grams(tok, kind))
+        postings = []
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if not posting:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+        if within is not None:
+            out = set(within)
+        elif postings:
+            out = set(postings.pop(0))
+        else:
+            return set(self._docnum.values())
+        for posting in postings:
+            if not out:
+                break
+            if len(out) * 16 < len(posting):
+                # 후보가 훨씬 적으면 긴 목록 전체를 훑지 않고 이진 탐색으로 확인한다.
+                out = {doc for doc in out if _sorted_contains(posting, doc)}
+            else:
+                out.intersection_update(posting)
+        return out
+
+    def _impact_order(self):
+        """(앞면이 짧은 순의 문서 번호, 그 순서로 이어 붙인 앞면/앞면 초성의 시작 위치, 앞면, 앞면 초성).
+        넓은 질의에서 앞면에 토큰이 있는 카드를 str.find로 짧은 것부터 바로 찾는 데 쓴다.
+        """
+        if self._impact is None:
+            docs = self._docs
+            order = array("i", sorted(self._docnum.values(), key=lambda d: len(docs[d][2])))
+            starts = array("i")
+            pos = 0
+            for doc in order:
+                starts.append(pos)
+                pos += len(docs[doc][2]) + 1
+            # 초성은 앞면과 길이가 같으므로 시작 위치를 함께 쓴다.
+            self._impact = (
+                order, starts,
+                "\n".join(docs[doc][2] for doc in order), "\n".join(docs[doc][4] for doc in order),
+            )
+        return self._impact
+
+    def _impact_cut(self, candidates, tok, kind):
+        """후보가 SEARCH_SCORE_CAP보다 많으면 점수가 높을 만한 것만 남긴다. (근사 top-k)
+        앞면 가중치와 BM25 길이 정규화 때문에 앞면에 토큰이 있고 앞면이 짧은 카드가 위로 오므로,
+        앞면에서 찾은 카드를 앞면이 짧은 순으로 먼저, 모자라면 나머지로 채운다.
+        후보가 전체의 일부면 후보만 훑고, 대부분이면 이어 붙인 앞면에서 찾아 색인 크기만큼 돌지 않는다.
+        """
+        docs = self._docs
+        field = 4 if kind == "choseong" else 2
+        if len(candidates) * 4 < len(self._docnum):
+            front_hits = [doc for doc in candidates if tok in docs[doc][field]]
+            if len(front_hits) > SEARCH_SCORE_CAP:
+                front_hits = heapq.nsmallest(SEARCH_SCORE_CAP, front_hits, key=lambda d: (len(docs[d][2]), d))
+        else:
+            order, starts, fronts, front_chos = self._impact_order()
+            text = front_chos if kind == "choseong" else fronts
+            front_hits = []
+            pos = text.find(tok)
+            while pos >= 0 and len(front_hits) < SEARCH_SCORE_CAP:
+                i = bisect.bisect_right(starts, pos) - 1
+                if order[i] in candidates:
+                    front_hits.append(order[i])
+                pos = text.find(tok, starts[i + 1]) if i + 1 < len(starts) else -1
+        need = SEARCH_SCORE_CAP - len(front_hits)
+        if need <= 0:
+            return front_hits
+        hit = set(front_hits)
+        rest = []
+        for doc in candidates:
+            if doc not in hit:
+                rest.append(doc)
+                if len(rest) >= need:
+                    break
+        return front_hits + rest
+
+    def ranked(self, query, category=None, limit=None):
+        """질의의 모든 토큰이 앞면이나 뒷면에 들어 있는 카드를 BM25 점수 순 [(card_id, 점수)]로 돌려준다.
+        초성만 쓴 토큰은 초성으로, 한글 토큰은 그대로 없으면 자모 단위로(입력 중인 마지막 글자) 찾는다.
+        category가 None이면 전체 카테고리에서 찾는다. 같은 점수는 카드 순서대로.
+        후보가 SEARCH_SCORE_CAP보다 많으면 _impact_cut으로 고른 후보만 채점한다. limit이 없으면 나머지 후보도
+        토큰이 들어 있는지만 확인해 점수 0으로 뒤에 붙이므로 결과 집합은 그대로이고 순서만 근사다.
+        후보가 적은 보통 질의는 자르지 않으므로 정확하다.
+        5만 장·20개 카테고리에서 캐시 없는 1~3글자 질의 (중앙값 / p90):
+          카테고리 하나: 약 3 ms / 13~15 ms (limit 유무 비슷)
+          전체, limit=10: 약 12 ms / 15 ms (색인이 바뀐 뒤 첫 넓은 질의는 _impact_order를 만드느라 약 90 ms)
+          전체, limit 없음: 약 19 ms / 55 ms
+        전부 채점하면 전체 limit 없음 p90이 약 200 ms였다. limit=10일 때 정확한 상위 10개와 평균 약 80% 겹친다.
+        """
+        tokens = [(tok, _query_token_kind(tok)) for tok in search_normalize(query).split()]
+        if not tokens:
+            return []
+        key = (tuple(tokens), category, limit)
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                return list(cached)
+            within = self._by_category.get(category, ()) if category is not None else None
+            candidates = self._candidates(tokens, within)
+            unscored = ()
+            if len(candidates) > SEARCH_SCORE_CAP:
+                cut = self._impact_cut(candidates, *tokens[0])
+                if limit is None:
+                    unscored = candidates.difference(cut)
+                candidates = cut
+            n_docs = max(len(self._docnum), 1)
+            avg_front = max(self._front_chars / n_docs, 1.0)
+            avg_back = max(self._back_chars / n_docs, 1.0)
+            terms = []
+            for tok, kind in tokens:
+                grams = _query_grams(tok, kind)
+                df = min((len(self._postings.get(g, ())) for g in grams), default=n_docs)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                whole = self._postings.get(_SEARCH_TOKEN + tok, ())
+                if len(candidates) * 16 >= len(whole):
+                    whole = set(whole)
+                terms.append((tok, kind, hangul_jamo(tok) if kind == "jamo" else None, idf, whole))
+            docs = self._docs
+            scored = []
+            # 2-gram이 모두 있어도 이어져 있지 않을 수 있으므로 실제 부분 문자열인지 여기서 확인한다.
+            for doc in candidates:
+                entry = docs[doc]
+                if entry is None:
+                    continue
+                front_norm = 1 - BM25_B + BM25_B * len(entry[2]) / avg_front
+                back_norm = 1 - BM25_B + BM25_B * len(entry[3]) / avg_back
+                score = 0.0
+                for tok, kind, tok_jamo, idf, whole in terms:
+                    front_tf, back_tf = _token_tf(entry, tok, kind, tok_jamo)
+                    if not (front_tf or back_tf):
+                        break
+                    tf = BM25_FRONT_BOOST * front_tf / front_norm + BM25_BACK_BOOST * back_tf / back_norm
+                    term_score = idf * tf * (BM25_K1 + 1) / (tf + BM25_K1)
+                    if doc in whole if isinstance(whole, set) else _sorted_contains(whole, doc):
+                        term_score *= SEARCH_WHOLE_TOKEN_BOOST
+                    score += term_score
+                else:
+                    item = (score, -doc, entry[0])
+                    if limit is None:
+                        scored.append(item)
+                    elif len(scored) < limit:
+                        heapq.heappush(scored, item)
+                    elif item > scored[0]:
+                        heapq.heapreplace(scored, item)
+            scored.sort(reverse=True)
+            result = [(cid, score) for score, _, cid in scored]
+            if unscored:
+                # 채점하지 않은 후보는 토큰이 실제로 들어 있는지만 확인해 카드 순서대로 점수 0으로 뒤에 붙인다.
+                rest = [doc for doc in sorted(unscored) if docs[doc] is not None]
+                for tok, kind, tok_jamo, _, _ in terms:
+                    if tok_jamo is not None:
+                        tok, field = tok_jamo, 6
+                    else:
+                        field = 4 if kind == "choseong" else 2
+                    rest = [doc for doc in rest if tok in docs[doc][field] or tok in docs[doc][field + 1]]
+                result.extend((docs[doc][0], 0.0) for doc in rest)
+            if len(self._results) >= SEARCH_RESULT_CACHE:
+                self._results.pop(next(iter(self._results)))
+            self._results[key] = result
+        return list(result)
+
+    def search(self, query, category=None, limit=None):
+        """ranked()의 카드 id만."""
+        return [cid for cid, _ in self.ranked(query, category, limit)]
+
+
+@st.cache_resource(show_spinner=False)
+def card_search_index():
+    return CardSearchIndex()
+
 # =======================
 # 👤 학습자별 진행 기록 (오답 기록용)
 # - flashcard_app 은 여러 학습자가 함께 쓰는 "공용 카드"이므로,
@@ -343,103 +1738,993 @@ def normalize_learner_name(name: str) -> str:
     """앞뒤 공백 제거 + 중간 연속 공백을 하나로 합쳐서 '민수'와 '민수 '를 같은 사람으로 취급"""
     return re.sub(r"\s+", " ", (name or "").strip())
 
+def is_admin_learner(name: str) -> bool:
+    """secrets의 ADMIN_LEARNERS(목록 또는 쉼표로 구분한 문자열)에 있는 학습자만 관리자 도구를 본다."""
+    admins = st.secrets.get("ADMIN_LEARNERS", [])
+    if isinstance(admins, str):
+        admins = admins.split(",")
+    name = normalize_learner_name(name)
+    return bool(name) and name in {normalize_learner_name(a) for a in admins}
+
 def learners_table_available():
     """학습자 전용 테이블 사용 가능 여부. 테이블이 없으면 기존 진행 기록 방식으로 안전하게 폴백한다."""
-    try:
-        supabase.table(LEARNERS_TABLE).select("learner").limit(1).execute()
-        return True
-    except Exception:
-        return False
+    return has_capability("learners_table")
 
 
 def register_learner(name: str):
     """학습자 이름을 카드 진행 기록과 독립적으로 영구 보존한다."""
-    name = normalize_learner_name(name)
-    if not name:
+    return register_learners([name])
+
+
+def register_learners(names):
+    """여러 학습자 이름을 한 번의 upsert로 보존한다. 이미 있는 이름은 건드리지 않는다."""
+    names = sorted({normalize_learner_name(n) for n in names or []} - {""})
+    if not names:
         return False
     try:
         supabase.table(LEARNERS_TABLE).upsert(
-            {"learner": name}, on_conflict="learner"
+            [{"learner": n} for n in names], on_conflict="learner", ignore_duplicates=True
         ).execute()
         return True
     except Exception:
         # 전용 테이블을 아직 만들지 않은 기존 설치에서도 앱 자체는 계속 동작한다.
         return False
+    finally:
+        _learner_names_cached.clear()
 
 
-def fetch_known_learners():
-    names = set()
+class CompactProgressMap:
+    """학습자 한 명의 카드별 오답 횟수·마지막 학습 시각을 세션에 적은 메모리로 보관한다.
+    행 dict 대신 card_id → 칸 번호 dict 하나와 array 두 개(오답 횟수, epoch 초)만 쓴다.
+    지운 칸은 재사용 목록에 넣었다가 다음 카드에 다시 쓴다.
+    """
+
+    def __init__(self, rows=()):
+        self._slots = {}
+        self._wrong = array("i")
+        self._reviewed = array("d")
+        self._free = []
+        for r in rows:
+            if r.get("card_id") is not None:
+                self.set(r["card_id"], r.get("wrong_count"), r.get("last_reviewed_at"))
+
+    @staticmethod
+    def _epoch(value):
+        if not value:
+            return 0.0
+        try:
+            ts = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return 0.0
+        # datetime.utcnow()로 찍은 예전 값은 시간대가 없으므로 UTC로 본다.
+        return (ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)).timestamp()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, card_id):
+        return card_id in self._slots
+
+    def wrong_count(self, card_id):
+        slot = self._slots.get(card_id)
+        return 0 if slot is None else self._wrong[slot]
+
+    def last_reviewed(self, card_id):
+        """마지막 학습 시각(epoch 초). 기록이 없으면 None."""
+        slot = self._slots.get(card_id)
+        return None if slot is None or not self._reviewed[slot] else self._reviewed[slot]
+
+    def set(self, card_id, wrong_count, last_reviewed_at=None):
+        slot = self._slots.get(card_id)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self._wrong)
+                self._wrong.append(0)
+                self._reviewed.append(0.0)
+            self._slots[card_id] = slot
+        self._wrong[slot] = int(wrong_count or 0)
+        self._reviewed[slot] = self._epoch(last_reviewed_at)
+
+    def update_rows(self, rows):
+        for r in rows:
+            if r.get("card_id") is not None:
+                self.set(r["card_id"], r.get("wrong_count"), r.get("last_reviewed_at"))
+
+    def discard(self, card_id):
+        slot = self._slots.pop(card_id, None)
+        if slot is not None:
+            self._wrong[slot] = 0
+            self._reviewed[slot] = 0.0
+            self._free.append(slot)
+
+    def items(self):
+        """(card_id, 오답 횟수)"""
+        return ((cid, self._wrong[slot]) for cid, slot in self._slots.items())
+
+    def rows(self):
+        """오프라인 스냅샷 등에 쓸 행 dict 목록. (필요할 때만 만든다)"""
+        out = []
+        for cid, slot in self._slots.items():
+            ts = self._reviewed[slot]
+            out.append({
+                "card_id": cid,
+                "wrong_count": self._wrong[slot],
+                "last_reviewed_at": datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None,
+            })
+        return out
+
+    def nbytes(self):
+        """실제로 쓰는 메모리(바이트): 칸 dict와 그 키(card_id)·값(칸 번호) + 두 array 버퍼 + 재사용 목록."""
+        return _objects_nbytes(
+            (self._slots, self._wrong, self._reviewed, self._free),
+            self._slots.keys(), self._slots.values(), self._free,
+        )
+
+
+def _objects_nbytes(*groups):
+    """객체들의 sys.getsizeof 합. 작은 정수·같은 키 문자열처럼 여럿이 함께 가리키는 객체는 한 번만 센다."""
+    seen = set()
+    total = 0
+    for group in groups:
+        for obj in group:
+            if id(obj) not in seen:
+                seen.add(id(obj))
+                total += sys.getsizeof(obj)
+    return total
+
+
+def _row_dicts_nbytes(learner, progress):
+    """같은 기록을 예전처럼 행 dict로 들고 있을 때의 메모리(바이트). 진단 화면의 비교용 측정.
+    nbytes()와 같은 방식으로 dict와 그 키·값을 모두 센다.
+    """
+    rows = {}
+    for r in progress.rows():
+        r["learner"] = learner
+        rows[r["card_id"]] = r
+    return _objects_nbytes(
+        (rows,), rows.values(),
+        (k for r in rows.values() for k in r), (v for r in rows.values() for v in r.values()),
+    )
+
+
+def benchmark_progress_memory(n=50000):
+    """임의의 카드 n장 기록으로 CompactProgressMap과 행 dict 방식의 메모리를 잰다.
+    두 방식 모두 tracemalloc으로 만든 뒤 남아 있는 할당량을 재므로 getsizeof 추정과 달리 빠지는 객체가 없다.
+    """
+    now = datetime.now(timezone.utc)
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
     try:
-        res = supabase.table(LEARNERS_TABLE).select("learner").execute().data or []
-        names.update(normalize_learner_name(r.get("learner")) for r in res if r.get("learner"))
+        start = tracemalloc.get_traced_memory()[0]
+        progress = CompactProgressMap(
+            {"card_id": 100000 + i, "wrong_count": i % 7, "last_reviewed_at": (now - timedelta(minutes=i)).isoformat()}
+            for i in range(n)
+        )
+        compact = tracemalloc.get_traced_memory()[0] - start
+        start = tracemalloc.get_traced_memory()[0]
+        rows = {}
+        for r in progress.rows():
+            r["learner"] = "benchmark"
+            rows[r["card_id"]] = r
+        dicts = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    return {"cards": n, "compact_bytes": compact, "row_dict_bytes": dicts, "ratio": round(dicts / max(compact, 1), 1)}
+
+
+def fetch_progress_map(learner, strict=False):
+    """학습자의 오답 기록을 CompactProgressMap으로 반환
+    화면은 오답 횟수만 쓰므로 오답이 있는 카드의 행만 받는다. (없는 카드는 오답 0회로 본다)
+    strict면 조회 실패 시 빈 기록 대신 None을 돌려준다.
+    """
+    learner = normalize_learner_name(learner)
+    if not learner or not has_capability("progress_table"):
+        return CompactProgressMap()
+    rows = []
+    try:
+        while True:
+            page = (
+                supabase.table(PROGRESS_TABLE).select("learner,card_id,wrong_count,last_reviewed_at")
+                .eq("learner", learner).gt("wrong_count", 0).order("card_id")
+                .range(len(rows), len(rows) + CARD_PAGE_SIZE - 1).execute().data or []
+            )
+            rows.extend(page)
+            if not page:
+                break
+        return CompactProgressMap(rows)
     except Exception:
-        pass
+        return None if strict else CompactProgressMap()
 
-    # 기존 사용자 자동 마이그레이션 및 전용 테이블 미설치 폴백
+# =======================
+# 📊 학습자별 카테고리 요약 (rollup)
+# - 카테고리 선택 목록에 "오답 카드 수 / 학습한 카드 수" 배지를 보여주기 위한 집계.
+#   DB 뷰가 있으면 학습자당 카테고리 수만큼의 행만 받는다.
+# - 뷰가 없는 설치에서는 이미 받아 둔 오답 기록(progress_map)으로 오답 카드 수만 센다.
+#
+#   create or replace view flashcard_progress_rollup as
+#   select p.learner, c.category,
+#          count(*) as reviewed_count,
+#          count(*) filter (where p.wrong_count > 0) as wrong_cards,
+#          coalesce(sum(p.wrong_count), 0) as wrong_total,
+#          max(p.last_reviewed_at) as last_reviewed_at
+#   from flashcard_progress p join flashcard_app c on c.id = p.card_id
+#   group by p.learner, c.category;
+# =======================
+PROGRESS_ROLLUP_VIEW = "flashcard_progress_rollup"
+PROGRESS_ROLLUP_TTL = 60
+
+
+@st.cache_data(ttl=PROGRESS_ROLLUP_TTL, show_spinner=False)
+def _fetch_progress_rollup(learner: str):
+    res = (
+        supabase.table(PROGRESS_ROLLUP_VIEW)
+        .select("category,reviewed_count,wrong_cards,wrong_total,last_reviewed_at")
+        .eq("learner", learner).execute().data or []
+    )
+    return {r["category"]: r for r in res if r.get("category") is not None}
+
+
+def fetch_category_rollup(learner, cards=None, progress_map=None):
+    """{카테고리: {"reviewed_count", "wrong_cards", ...}}. 학습 수를 모르면 reviewed_count는 None."""
+    learner = normalize_learner_name(learner)
+    if not learner:
+        return {}
+    if has_capability("progress_rollup_view"):
+        try:
+            return _fetch_progress_rollup(learner)
+        except Exception:
+            pass
+    rollup = {}
+    if cards is not None:
+        for cid, wrong in (progress_map.items() if progress_map is not None else ()):
+            card = cards.get(cid)
+            if card is not None and wrong > 0:
+                r = rollup.setdefault(card.get("category"), {"reviewed_count": None, "wrong_cards": 0})
+                r["wrong_cards"] += 1
+    return rollup
+
+
+def category_badge_label(category, rollup):
+    r = (rollup or {}).get(category)
+    if not r:
+        return category
+    if r.get("reviewed_count") is None:
+        return f"{category}  · ❗{r.get('wrong_cards', 0)}" if r.get("wrong_cards") else category
+    return f"{category}  · ❗{r.get('wrong_cards', 0)} / 📖{r['reviewed_count']}"
+
+
+# =======================
+# 🗓️ 간격 반복 스케줄러 (SM-2)
+# - ✅/❌를 SM-2 품질 점수로 바꿔 카드별 간격(interval_days)·난이도(ease)·다음 복습 시각(due_at)을 계산해
+#   flashcard_progress에 함께 저장한다. 오답 카드는 RELEARN_DELAY_MINUTES 뒤 다시 나온다.
+# - "⏰ 복습할 카드" 모드는 due_at 순 최소 힙(DueQueue)에서 다음 카드를 꺼낸다. (O(log n))
+#   한 번도 학습하지 않은 카드는 바로 복습 대상이며 카드 순서대로 나온다.
+#
+#   alter table flashcard_progress
+#     add column if not exists interval_days real default 0,
+#     add column if not exists ease real default 2.5,
+#     add column if not exists due_at timestamptz,
+#     add column if not exists reps int default 0,
+#     add column if not exists lapses int default 0;
+#   create index if not exists flashcard_progress_due_idx on flashcard_progress (learner, due_at);
+# =======================
+SCHEDULE_COLUMNS = ("interval_days", "ease", "due_at", "reps", "lapses")
+SM2_DEFAULT_EASE = 2.5
+SM2_MIN_EASE = 1.3
+SM2_QUALITY = {True: 4, False: 2}  # ✅ = 약간 망설였지만 맞힘, ❌ = 틀림
+RELEARN_DELAY_MINUTES = 10
+DUE_ORDER_MODE = "⏰ 복습할 카드"
+
+
+def sm2_next(state, correct, now):
+    """이전 스케줄 상태(dict 또는 None)와 정답 여부로 다음 상태를 계산한다."""
+    state = state or {}
+    reps = int(state.get("reps") or 0)
+    lapses = int(state.get("lapses") or 0)
+    interval = float(state.get("interval_days") or 0)
+    ease = float(state.get("ease") or SM2_DEFAULT_EASE)
+
+    q = SM2_QUALITY[bool(correct)]
+    ease = max(SM2_MIN_EASE, ease + 0.1 - (5 - q) * (0.08 + (5 - q) * 0.02))
+    if correct:
+        reps += 1
+        interval = 1.0 if reps == 1 else 6.0 if reps == 2 else round(interval * ease, 2)
+        due = now + timedelta(days=interval)
+    else:
+        reps = 0
+        lapses += 1
+        interval = 0.0
+        due = now + timedelta(minutes=RELEARN_DELAY_MINUTES)
+    return {
+        "interval_days": interval,
+        "ease": round(ease, 3),
+        "due_at": due.isoformat(),
+        "reps": reps,
+        "lapses": lapses,
+    }
+
+
+def due_timestamp(state):
+    """스케줄 상태의 due_at(epoch 초). 학습한 적 없으면 0 (= 지금 바로)."""
+    due = (state or {}).get("due_at")
+    if not due:
+        return 0.0
     try:
-        res = supabase.table(PROGRESS_TABLE).select("learner").execute().data or []
-        progress_names = {
-            normalize_learner_name(r.get("learner")) for r in res if r.get("learner")
-        }
-        names.update(progress_names)
-        for name in progress_names:
-            if name:
-                register_learner(name)
+        return datetime.fromisoformat(due).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def fetch_schedule_map(learner, strict=False):
+    """{card_id: 스케줄 상태}. 스케줄 컬럼이 없는 설치나 조회 실패 시 {}. (strict면 조회 실패 시 None)"""
+    learner = normalize_learner_name(learner)
+    if not learner or not has_capability("progress_schedule"):
+        return {}
+    rows = []
+    try:
+        while True:
+            page = (
+                supabase.table(PROGRESS_TABLE).select("card_id," + ",".join(SCHEDULE_COLUMNS))
+                .eq("learner", learner).not_.is_("due_at", "null").order("card_id")
+                .range(len(rows), len(rows) + CARD_PAGE_SIZE - 1).execute().data or []
+            )
+            rows.extend(page)
+            if not page:
+                break
+        return {r["card_id"]: r for r in rows}
     except Exception:
-        pass
+        return None if strict else {}
+
+
+class DueQueue:
+    """due_at 순 최소 힙. 같은 카드를 다시 넣으면 이전 항목은 꺼낼 때 버린다(지연 삭제)."""
+
+    def __init__(self, card_ids, schedule_map):
+        self._due = {}
+        self._seq = 0
+        self._heap = []
+        for cid in card_ids:
+            self._due[cid] = due_timestamp(schedule_map.get(cid))
+            self._heap.append((self._due[cid], self._seq, cid))
+            self._seq += 1
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._due)
+
+    def _top(self):
+        while self._heap:
+            due, _, cid = self._heap[0]
+            if self._due.get(cid) == due:
+                return due, cid
+            heapq.heappop(self._heap)
+        return None
+
+    def peek(self, now_ts):
+        """지금 복습할 카드 id. 없으면 None."""
+        top = self._top()
+        return top[1] if top and top[0] <= now_ts else None
+
+    def next_due_at(self):
+        top = self._top()
+        return top[0] if top else None
 
+    def push(self, card_id, due_ts):
+        if card_id not in self._due:
+            return
+        self._due[card_id] = due_ts
+        heapq.heappush(self._heap, (due_ts, self._seq, card_id))
+        self._seq += 1
+
+
+def upsert_progress_rows(rows):
+    """여러 카드의 진행 기록을 한 번의 다중 행 upsert로 저장한다. 경고 표시는 호출한 쪽이 정한다."""
+    if not rows:
+        return True
+    try:
+        supabase.table(PROGRESS_TABLE).upsert(list(rows), on_conflict="learner,card_id").execute()
+        return True
+    except Exception:
+        return False
+
+# =======================
+# 🧹 진행 기록 일괄 삭제
+# - 초기화·카드 삭제 등 진행 기록을 지우는 모든 경로가 bulk_delete_progress 하나를 쓴다.
+# - card_id 목록은 인코딩된 in.(...) 필터 길이가 PROGRESS_DELETE_URL_BUDGET을 넘지 않게 나누고,
+#   조각들은 최대 PROGRESS_DELETE_WORKERS개씩 동시에 지운다. 실패한 조각의 id는 모아서 돌려준다.
+# - 학습자+카테고리 단위 삭제는 RPC가 있으면 서버에서 한 번에 처리한다.
+#
+#   create or replace function flashcard_progress_delete_by_category(p_category text, p_learner text)
+#   returns int language sql as $$
+#     with d as (
+#       delete from flashcard_progress p using flashcard_app c
+#       where c.id = p.card_id and c.category = p_category and p.learner = p_learner
+#       returning 1)
+#     select count(*)::int from d;
+#   $$;
+# =======================
+PROGRESS_DELETE_URL_BUDGET = 4000  # in.(...) 필터 하나에 허용하는 인코딩 후 길이(바이트)
+PROGRESS_DELETE_WORKERS = 4
+PROGRESS_DELETE_BY_CATEGORY_RPC = "flashcard_progress_delete_by_category"
+
+
+def _chunk_ids_by_url(ids, budget=PROGRESS_DELETE_URL_BUDGET):
+    """인코딩된 길이(쉼표 %2C 포함) 기준으로 id 목록을 나눈다."""
+    chunks, chunk, size = [], [], 0
+    for cid in ids:
+        cost = len(quote(str(cid), safe="")) + 3
+        if chunk and size + cost > budget:
+            chunks.append(chunk)
+            chunk, size = [], 0
+        chunk.append(cid)
+        size += cost
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def bulk_delete_progress(card_ids, learner=None, category=None):
+    """진행 기록을 지우고 실패한 card_id 목록을 돌려준다. (빈 목록이면 모두 성공)
+    learner를 주면 그 학습자 기록만, category도 주면 RPC로 서버에서 한 번에 지운다.
+    """
+    ids = [cid for cid in dict.fromkeys(card_ids or []) if cid is not None]
+    if not ids:
+        return []
+    learner = normalize_learner_name(learner) if learner is not None else None
+    if learner and category is not None:
+        try:
+            if _call_rpc(PROGRESS_DELETE_BY_CATEGORY_RPC, {"p_category": category, "p_learner": learner}) is not None:
+                return []
+        except Exception:
+            pass  # id 목록으로 다시 시도한다
+
+    def _delete_chunk(chunk):
+        try:
+            query = supabase.table(PROGRESS_TABLE).delete(returning=ReturnMethod.minimal)
+            if learner is not None:
+                query = query.eq("learner", learner)
+            query.in_("card_id", chunk).execute()
+            return []
+        except Exception:
+            return chunk
+
+    chunks = _chunk_ids_by_url(ids)
+    if len(chunks) == 1:
+        failed = _delete_chunk(chunks[0])
+    else:
+        with ThreadPoolExecutor(max_workers=min(PROGRESS_DELETE_WORKERS, len(chunks))) as pool:
+            failed = [cid for part in pool.map(_delete_chunk, chunks) for cid in part]
+    # 학습자를 정하지 않은 삭제(카드 삭제 등)는 모든 학습자의 집계에 걸리므로 전부 비운다.
+    if learner is not None:
+        _fetch_progress_rollup.clear(learner)
+    else:
+        _fetch_progress_rollup.clear()
+    return failed
+
+
+def reset_progress(learner, card_ids, category=None):
+    learner = normalize_learner_name(learner)
+    if not card_ids:
+        return True
+    failed = bulk_delete_progress(card_ids, learner=learner, category=category)
+    if failed:
+        st.warning(
+            f"⚠️ 학습 기록 {len(card_ids)}건 중 {len(failed)}건을 초기화하지 못했습니다. "
+            "(flashcard_progress 테이블/네트워크 확인)"
+        )
+        return False
+    return True
+
+def fetch_progress_rows():
+    """백업용: 전체 학습자의 진행 기록을 통째로 가져오기"""
+    try:
+        return supabase.table(PROGRESS_TABLE).select("*").execute().data or []
+    except Exception:
+        return []
+
+# =======================
+# 🧭 학습자 이름 마이그레이션 (1회)
+# - 예전 설치는 학습자 이름이 flashcard_progress(학습자×카드 행)에만 남아 있다.
+#   이 이름들을 flashcard_learners로 한 번만 일괄 옮기고, flashcard_app_meta에 완료 표시를 남긴다.
+# - 메타 테이블이 없으면 서버 프로세스마다 한 번만 옮긴다. (upsert라 여러 번 돌아도 안전)
+# - 진행 기록에서 이름을 모을 때는 전체 행을 받지 않는다. distinct RPC가 있으면 쓰고,
+#   없으면 (learner, card_id) 기본키 순서로 "다음 이름"만 한 행씩 건너뛰며 읽는다.
+#
+#   create table if not exists flashcard_app_meta (
+#     key text primary key, value text, updated_at timestamptz default now());
+#   create or replace function flashcard_progress_learners()
+#   returns table(learner text) language sql stable as $$
+#     select distinct learner from flashcard_progress where learner <> '';
+#   $$;
+# =======================
+META_TABLE = "flashcard_app_meta"
+LEARNER_MIGRATION_KEY = "learners_migrated_v1"
+PROGRESS_LEARNERS_RPC = "flashcard_progress_learners"
+LEARNER_LIST_TTL = 60  # 학습자 목록 재사용 시간(초). 새 이름 등록 시에는 바로 비운다.
+
+
+def _distinct_progress_learners():
+    """flashcard_progress에 등장하는 학습자 이름 집합. 조회 실패 시 예외를 올린다."""
+    rows = _call_rpc(PROGRESS_LEARNERS_RPC, {})
+    if rows is not None:
+        return {normalize_learner_name(r.get("learner")) for r in rows} - {""}
+    names, last = set(), ""
+    while True:
+        res = (
+            supabase.table(PROGRESS_TABLE).select("learner")
+            .gt("learner", last).order("learner").limit(1).execute().data or []
+        )
+        if not res:
+            return names - {""}
+        last = res[0]["learner"]
+        names.add(normalize_learner_name(last))
+
+
+def _meta_get(key: str):
+    """메타 값. 값이 없으면 "", 메타 테이블이 없거나 조회할 수 없으면 None."""
+    if not has_capability("meta_table"):
+        return None
+    try:
+        res = supabase.table(META_TABLE).select("value").eq("key", key).limit(1).execute().data or []
+        return (res[0].get("value") or "") if res else ""
+    except Exception:
+        return None
+
+
+def _meta_set(key: str, value: str):
+    if not has_capability("meta_table"):
+        return False
+    try:
+        supabase.table(META_TABLE).upsert({"key": key, "value": value}, on_conflict="key").execute()
+        return True
+    except Exception:
+        return False
+
+
+@st.cache_resource(show_spinner=False)
+def _learner_migration_state():
+    return {"done": False, "lock": threading.Lock()}
+
+
+def migrate_learners_once():
+    """진행 기록의 학습자 이름을 전용 테이블로 옮기는 일을 설치당(메타 테이블이 없으면 프로세스당) 한 번만 한다."""
+    state = _learner_migration_state()
+    if state["done"]:
+        return True
+    with state["lock"]:
+        if state["done"]:
+            return True
+        if _meta_get(LEARNER_MIGRATION_KEY):
+            state["done"] = True
+            return True
+        try:
+            names = _distinct_progress_learners()
+        except Exception:
+            return False
+        if names and not register_learners(names):
+            return False
+        _meta_set(LEARNER_MIGRATION_KEY, datetime.now(timezone.utc).isoformat())
+        state["done"] = True
+        return True
+
+
+@st.cache_data(ttl=LEARNER_LIST_TTL, show_spinner=False)
+def _learner_names_cached():
+    """전용 테이블이 있으면 그 목록을, 없으면 진행 기록의 distinct 이름을 돌려준다."""
+    if learners_table_available():
+        migrate_learners_once()
+        res = supabase.table(LEARNERS_TABLE).select("learner").execute().data or []
+        names = {normalize_learner_name(r.get("learner")) for r in res}
+    else:
+        names = _distinct_progress_learners()
     return sorted(n for n in names if n)
 
 
+def fetch_known_learners():
+    try:
+        return _learner_names_cached()
+    except Exception:
+        return []
+
+
 def fetch_learner_rows():
     try:
         return supabase.table(LEARNERS_TABLE).select("*").execute().data or []
     except Exception:
         return [{"learner": n} for n in fetch_known_learners()]
 
+# =======================
+# ➕ 오답 횟수 원자적 증가
+# - "현재 값 + 1"을 클라이언트가 계산해 덮어쓰면 두 탭·두 학습자가 동시에 누를 때 하나가 사라진다.
+#   증가분만 보내고 더하기는 DB가 한 문장 안에서 하도록 RPC를 쓴다. 여러 카드를 한 번에 보낼 수 있다.
+# - RPC를 아직 만들지 않은 설치에서는 DB의 현재 값을 읽어 더한 뒤 쓰는 로컬 대체 경로로 동작한다.
+#   (원자적이지 않지만 세션 상태가 아닌 DB 값을 기준으로 더한다)
+#
+#   create or replace function flashcard_app_increment_wrong(p_card_ids bigint[], p_amounts int[])
+#   returns table(id bigint, wrong_count int) language sql as $$
+#     update flashcard_app a set wrong_count = coalesce(a.wrong_count, 0) + d.amount
+#     from unnest(p_card_ids, p_amounts) as d(card_id, amount)
+#     where a.id = d.card_id
+#     returning a.id, a.wrong_count;
+#   $$;
+#   create or replace function flashcard_progress_increment(
+#     p_learner text, p_card_ids bigint[], p_amounts int[], p_reviewed_at timestamptz[])
+#   returns setof flashcard_progress language sql as $$
+#     insert into flashcard_progress as p (learner, card_id, wrong_count, last_reviewed_at)
+#     select p_learner, d.card_id, d.amount, d.reviewed_at
+#     from unnest(p_card_ids, p_amounts, p_reviewed_at) as d(card_id, amount, reviewed_at)
+#     on conflict (learner, card_id) do update
+#       set wrong_count = coalesce(p.wrong_count, 0) + excluded.wrong_count,
+#           last_reviewed_at = greatest(p.last_reviewed_at, excluded.last_reviewed_at)
+#     returning p.*;
+#   $$;
+# =======================
+CARD_INCREMENT_RPC = "flashcard_app_increment_wrong"
+PROGRESS_INCREMENT_RPC = "flashcard_progress_increment"
 
-def fetch_progress_map(learner):
-    """{card_id: {"wrong_count":.., "last_reviewed_at":..}} 형태로 반환"""
-    learner = normalize_learner_name(learner)
-    if not learner:
-        return {}
+
+def _call_rpc(fn: str, params: dict):
+    """RPC 결과 행 목록. 함수가 DB에 없으면 None, 그 밖의 오류는 그대로 올린다."""
+    if not has_capability(fn):
+        return None
     try:
-        res = supabase.table(PROGRESS_TABLE).select("*").eq("learner", learner).execute().data or []
-        return {r["card_id"]: r for r in res}
-    except Exception:
-        return {}
+        return supabase.rpc(fn, params).execute().data or []
+    except APIError as e:
+        if e.code in _SCHEMA_MISSING_CODES:
+            # 확인 후 함수가 지워진 경우: 다음 호출부터 대체 경로를 쓰도록 다시 확인하게 한다.
+            refresh_schema_capabilities()
+            return None
+        raise
 
-def upsert_progress(learner, card_id, wrong_count, last_reviewed_at):
+
+def increment_progress(learner, deltas):
+    """deltas: {card_id: (오답 증가분, 학습 시각 ISO)}. 저장된 최종 행 목록, 실패 시 None."""
     learner = normalize_learner_name(learner)
+    if not learner or not deltas:
+        return []
+    card_ids = list(deltas)
     try:
-        supabase.table(PROGRESS_TABLE).upsert({
+        rows = _call_rpc(PROGRESS_INCREMENT_RPC, {
+            "p_learner": learner,
+            "p_card_ids": card_ids,
+            "p_amounts": [int(deltas[cid][0]) for cid in card_ids],
+            "p_reviewed_at": [deltas[cid][1] for cid in card_ids],
+        })
+        if rows is not None:
+            return rows
+        current = {}
+        for i in range(0, len(card_ids), 200):
+            res = (
+                supabase.table(PROGRESS_TABLE).select("card_id,wrong_count,last_reviewed_at")
+                .eq("learner", learner).in_("card_id", card_ids[i:i + 200]).execute().data or []
+            )
+            current.update({r["card_id"]: r for r in res})
+    except Exception:
+        return None
+
+    rows = []
+    for cid in card_ids:
+        amount, reviewed_at = deltas[cid]
+        prev = current.get(cid) or {}
+        rows.append({
             "learner": learner,
-            "card_id": card_id,
-            "wrong_count": wrong_count,
-            "last_reviewed_at": last_reviewed_at,
-        }, on_conflict="learner,card_id").execute()
+            "card_id": cid,
+            "wrong_count": int(prev.get("wrong_count") or 0) + int(amount),
+            "last_reviewed_at": max(reviewed_at, prev.get("last_reviewed_at") or ""),
+        })
+    return rows if upsert_progress_rows(rows) else None
+
+
+def increment_card_wrong_counts(amounts):
+    """amounts: {card_id: 증가분}. 공용 카드의 예전 wrong_count 컬럼을 올린다. 반영된 (id, wrong_count) 행, 실패 시 None."""
+    card_ids = [cid for cid, n in amounts.items() if n]
+    if not card_ids:
+        return []
+    try:
+        rows = _call_rpc(CARD_INCREMENT_RPC, {
+            "p_card_ids": card_ids,
+            "p_amounts": [int(amounts[cid]) for cid in card_ids],
+        })
+        if rows is None:
+            current = (
+                supabase.table(TABLE).select("id,wrong_count").in_("id", card_ids).execute().data or []
+            )
+            rows = []
+            for r in current:
+                new_count = int(r.get("wrong_count") or 0) + int(amounts[r["id"]])
+                supabase.table(TABLE).update({"wrong_count": new_count}).eq("id", r["id"]).execute()
+                rows.append({"id": r["id"], "wrong_count": new_count})
+        return rows
+    except Exception:
+        return None
+
+# =======================
+# 📈 학습 통계 (리뷰 이벤트 + 일별 집계)
+# - ✅/❌ 한 번마다 작은 이벤트 행(flashcard_review_events)을 남긴다. id는 클라이언트가 만든 uuid라
+#   재시도·저널 재생으로 같은 이벤트를 다시 보내도 한 번만 들어간다(ignore-duplicates).
+# - 이벤트가 들어올 때마다 트리거가 학습자×카테고리×날짜(KST) 카운터(flashcard_daily_stats)를 1씩 올린다.
+#   통계 화면은 이 카운터만 읽으므로 이벤트가 아무리 쌓여도 조회 비용은 기간 길이에만 비례한다.
+#
+#   create table if not exists flashcard_review_events (
+#     id uuid primary key, learner text not null, card_id bigint not null, category text,
+#     correct boolean not null, reviewed_at timestamptz not null default now());
+#   create table if not exists flashcard_daily_stats (
+#     learner text not null, category text not null, day date not null,
+#     reviews int not null default 0, correct int not null default 0,
+#     primary key (learner, category, day));
+#   create or replace function flashcard_daily_stats_apply() returns trigger language plpgsql as $$
+#   begin
+#     insert into flashcard_daily_stats as s (learner, category, day, reviews, correct)
+#     values (new.learner, coalesce(new.category, ''), (new.reviewed_at at time zone 'Asia/Seoul')::date,
+#             1, new.correct::int)
+#     on conflict (learner, category, day) do update
+#       set reviews = s.reviews + 1, correct = s.correct + excluded.correct;
+#     return new;
+#   end $$;
+#   create trigger flashcard_review_events_rollup after insert on flashcard_review_events
+#     for each row execute function flashcard_daily_stats_apply();
+# =======================
+REVIEW_EVENTS_TABLE = "flashcard_review_events"
+DAILY_STATS_TABLE = "flashcard_daily_stats"
+DAILY_STATS_TTL = 60
+
+
+def make_review_event(learner, card_id, category, correct, reviewed_at, event_id=None):
+    return {
+        "id": event_id or str(uuid.uuid4()),
+        "learner": normalize_learner_name(learner),
+        "card_id": card_id,
+        "category": category,
+        "correct": bool(correct),
+        "reviewed_at": reviewed_at,
+    }
+
+
+def insert_review_events(events):
+    """이벤트를 200개씩 저장한다. 이미 들어간 id는 건너뛴다. 이벤트 테이블이 없으면 버리고 True."""
+    if not events or not has_capability("review_events"):
+        return True
+    try:
+        for i in range(0, len(events), 200):
+            supabase.table(REVIEW_EVENTS_TABLE).upsert(
+                events[i:i + 200], on_conflict="id", ignore_duplicates=True, returning=ReturnMethod.minimal
+            ).execute()
+        # 캐시 키가 (학습자, 시작일)이라 학습자만으로는 지울 수 없으므로, 그 학습자의 판 번호를 올려 새로 받게 한다.
+        versions = _daily_stats_versions()
+        for learner in {e.get("learner") for e in events}:
+            versions[learner] = versions.get(learner, 0) + 1
         return True
     except Exception:
-        st.warning("⚠️ 학습 기록 저장 실패 (flashcard_progress 테이블/네트워크 확인)")
         return False
 
-def reset_progress(learner, card_ids):
+
+@st.cache_resource(show_spinner=False)
+def _daily_stats_versions():
+    return {}  # 학습자 → 이벤트를 넣을 때마다 올리는 번호 (지난 번호의 캐시는 TTL로 사라진다)
+
+
+@st.cache_data(ttl=DAILY_STATS_TTL, show_spinner=False)
+def _fetch_daily_stats(learner: str, since_day: str, version: int = 0):
+    rows = []
+    while True:
+        page = (
+            supabase.table(DAILY_STATS_TABLE).select("category,day,reviews,correct")
+            .eq("learner", learner).gte("day", since_day).order("day").order("category")
+            .range(len(rows), len(rows) + CARD_PAGE_SIZE - 1).execute().data or []
+        )
+        rows.extend(page)
+        if len(page) < CARD_PAGE_SIZE:
+            return rows
+
+
+def fetch_daily_stats(learner, days):
+    """최근 days일(KST)의 [{"category","day","reviews","correct"}]. 집계 테이블이 없거나 실패하면 None."""
     learner = normalize_learner_name(learner)
-    if not card_ids:
+    if not learner or not has_capability("daily_stats"):
+        return None
+    since = (datetime.now(KST).date() - timedelta(days=days - 1)).isoformat()
+    try:
+        return _fetch_daily_stats(learner, since, _daily_stats_versions().get(learner, 0))
+    except Exception:
+        return None
+
+# =======================
+# 📴 오프라인 학습 (로컬 스냅샷 + 학습 저널)
+# - 온라인일 때 카드 색인·받아 둔 상세 내용과 학습자별 진행 기록을 로컬 디렉터리에 스냅샷으로 남긴다.
+# - Supabase가 잠들었거나 연결되지 않으면 그 스냅샷으로 암기 모드를 계속할 수 있고,
+#   그동안의 정답/오답은 append-only JSONL 저널(reviews.jsonl)에 한 줄씩 쌓는다.
+# - 연결이 돌아오면 저널을 학습자별 증가분으로 묶어 다시 보낸다. 반영한 줄의 id는 replayed.txt에
+#   적어 두므로 여러 번 재생해도 같은 기록이 두 번 더해지지 않는다. 모두 반영되면 두 파일을 비운다.
+# - 디렉터리: secrets의 OFFLINE_DIR → 환경변수 FLASHCARD_OFFLINE_DIR → ./.flashcard_offline
+# =======================
+OFFLINE_SNAPSHOT_EVERY = 120  # 증분 동기화로 바뀐 스냅샷은 최대 이 간격(초)으로만 다시 저장한다
+OFFLINE_CARDS_FILE = "cards_snapshot.json"
+OFFLINE_JOURNAL_FILE = "reviews.jsonl"
+OFFLINE_LEDGER_FILE = "replayed.txt"
+
+
+def offline_dir():
+    path = st.secrets.get("OFFLINE_DIR") or os.environ.get("FLASHCARD_OFFLINE_DIR") or ".flashcard_offline"
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _offline_path(name: str):
+    return os.path.join(offline_dir(), name)
+
+
+@st.cache_resource(show_spinner=False)
+def _offline_lock():
+    """저널 추가·재생이 세션 사이에 겹치지 않게 하는 프로세스 공용 잠금."""
+    return threading.Lock()
+
+
+def _write_json_atomic(name: str, obj):
+    """임시 파일에 쓴 뒤 교체해, 쓰는 도중 꺼져도 이전 스냅샷이 깨지지 않게 한다."""
+    path = _offline_path(name)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _read_json(name: str):
+    try:
+        with open(_offline_path(name), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_offline_cards(rows, details):
+    try:
+        _write_json_atomic(OFFLINE_CARDS_FILE, {
+            "saved_at": datetime.now(timezone.utc).isoformat(),
+            "cards": list(rows),
+            "details": list(details.values()),
+        })
         return True
+    except OSError:
+        return False
+
+
+def load_offline_cards():
+    """(카드 색인 행 목록, {id: 상세 행}, 저장 시각). 스냅샷이 없으면 None."""
+    data = _read_json(OFFLINE_CARDS_FILE)
+    if not isinstance(data, dict) or not data.get("cards"):
+        return None
+    details = {d["id"]: d for d in data.get("details") or [] if isinstance(d, dict) and "id" in d}
+    return data["cards"], details, data.get("saved_at")
+
+
+def _offline_progress_file(learner: str):
+    digest = hashlib.sha1(normalize_learner_name(learner).encode("utf-8")).hexdigest()[:16]
+    return f"progress_{digest}.json"
+
+
+def save_offline_progress(learner, progress_map, schedule_map):
     try:
-        supabase.table(PROGRESS_TABLE).delete().eq("learner", learner).in_("card_id", card_ids).execute()
+        _write_json_atomic(_offline_progress_file(learner), {
+            "learner": normalize_learner_name(learner),
+            "progress": progress_map.rows(),
+            "schedule": [{"card_id": cid, **sched} for cid, sched in schedule_map.items()],
+        })
         return True
-    except Exception:
-        st.warning("⚠️ 학습 기록 초기화 실패 (flashcard_progress 테이블/네트워크 확인)")
+    except OSError:
         return False
 
-def fetch_progress_rows():
-    """백업용: 전체 학습자의 진행 기록을 통째로 가져오기"""
+
+def load_offline_progress(learner):
+    """마지막으로 저장한 (CompactProgressMap, schedule_map). 없으면 빈 값."""
+    data = _read_json(_offline_progress_file(learner)) or {}
+    progress = CompactProgressMap(r for r in data.get("progress") or [] if isinstance(r, dict))
+    schedule = {
+        r["card_id"]: {k: r.get(k) for k in SCHEDULE_COLUMNS}
+        for r in data.get("schedule") or [] if "card_id" in r
+    }
+    return progress, schedule
+
+
+def append_offline_reviews(entries):
+    """(learner, card_id, 오답 증가분, 학습 시각, 스케줄, 카테고리) 목록을 저널에 추가한다.
+    카테고리가 있는 줄은 재생할 때 리뷰 이벤트로도 남는다. (줄 id = 이벤트 id)
+    """
+    lines = [
+        json.dumps({
+            "id": str(uuid.uuid4()), "learner": normalize_learner_name(learner), "card_id": cid,
+            "wrong_delta": int(delta), "reviewed_at": reviewed_at, "schedule": schedule, "category": category,
+        }, ensure_ascii=False)
+        for learner, cid, delta, reviewed_at, schedule, category in entries
+    ]
+    if not lines:
+        return True
     try:
-        return supabase.table(PROGRESS_TABLE).select("*").execute().data or []
+        with _offline_lock(), open(_offline_path(OFFLINE_JOURNAL_FILE), "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return True
+    except OSError:
+        return False
+
+
+def _read_offline_journal():
+    """(아직 반영하지 않은 저널 항목, 반영한 id 집합)"""
+    entries = []
+    try:
+        with open(_offline_path(OFFLINE_JOURNAL_FILE), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue  # 쓰다 만 마지막 줄
+    except OSError:
+        return [], set()
+    try:
+        with open(_offline_path(OFFLINE_LEDGER_FILE), encoding="utf-8") as f:
+            done = {line.strip() for line in f if line.strip()}
+    except OSError:
+        done = set()
+    return [e for e in entries if e.get("id") not in done], done
+
+
+def pending_offline_reviews():
+    try:
+        return len(_read_offline_journal()[0])
     except Exception:
-        return []
+        return 0
+
+
+def replay_offline_journal():
+    """저널을 flashcard_progress에 반영한다. 반환: 반영한 항목 수, 연결 실패로 멈췄으면 None."""
+    try:
+        if os.path.getsize(_offline_path(OFFLINE_JOURNAL_FILE)) == 0:
+            return 0
+    except OSError:
+        return 0
+    with _offline_lock():
+        todo, _ = _read_offline_journal()
+        by_learner = {}
+        for e in todo:
+            if e.get("learner") and e.get("card_id") is not None:
+                by_learner.setdefault(e["learner"], []).append(e)
+
+        applied = 0
+        for learner, items in by_learner.items():
+            deltas, schedules = {}, {}
+            for e in sorted(items, key=lambda e: e.get("reviewed_at") or ""):
+                prev = deltas.get(e["card_id"], (0, ""))
+                deltas[e["card_id"]] = (prev[0] + int(e.get("wrong_delta") or 0), max(prev[1], e.get("reviewed_at") or ""))
+                if e.get("schedule"):
+                    schedules[e["card_id"]] = e["schedule"]
+            events = [
+                make_review_event(learner, e["card_id"], e["category"], not e.get("wrong_delta"), e.get("reviewed_at"), e["id"])
+                for e in items if e.get("category") is not None
+            ]
+            # 이벤트는 id로 중복이 걸러지므로 먼저 보내고, 증가분을 보낸 직후에 기록부에 적는다.
+            if not insert_review_events(events) or increment_progress(learner, deltas) is None:
+                return None
+            if schedules and has_capability("progress_schedule"):
+                upsert_progress_rows([{"learner": learner, "card_id": cid, **sc} for cid, sc in schedules.items()])
+            with open(_offline_path(OFFLINE_LEDGER_FILE), "a", encoding="utf-8") as f:
+                f.write("".join(e["id"] + "\n" for e in items))
+                f.flush()
+                os.fsync(f.fileno())
+            applied += len(items)
+            _fetch_progress_rollup.clear(normalize_learner_name(learner))
+
+        # 모두 반영됐으면 저널과 기록부를 함께 비운다. (남은 줄이 있으면 다음 재생에서 이어서)
+        if not _read_offline_journal()[0]:
+            for name in (OFFLINE_JOURNAL_FILE, OFFLINE_LEDGER_FILE):
+                try:
+                    os.remove(_offline_path(name))
+                except OSError:
+                    pass
+        return applied
 
 # =======================
 # 💾 백업 (카드 + 학습자별 진행 기록을 함께 저장)
@@ -647,40 +2932,46 @@ def extract_cards_from_pdf(file_bytes: bytes):
                 })
     return cards
 
-def insert_card(category, front, back, front_img, back_img, make_backup=True):
+# 카드 쓰기 helper는 returning=representation으로 바뀐 행을 돌려받아 공용 카드 저장소에 바로 반영한다.
+# 성공 시 영향받은 행 목록, 실패 시 None을 반환하므로 호출부는 전체 재조회 없이 화면을 갱신할 수 있다.
+def insert_card(category, front, back, front_img, back_img, make_backup=True, apply_local=True):
     try:
-        supabase.table(TABLE).insert({
+        rows = supabase.table(TABLE).insert({
             "category": category,
             "front": front,
             "back": back,
             "front_image_url": front_img,
             "back_image_url": back_img,
             "wrong_count": 0
-        }).execute()
+        }, returning=ReturnMethod.representation).execute().data or []
+        # 여러 장을 잇달아 넣는 호출부는 apply_local=False로 모았다가 한 번에 반영한다.
+        if apply_local:
+            card_store().apply_local(changed=rows)
         if make_backup:
             auto_backup()
-        clear_cards_cache()
-        return True
+        return rows
     except Exception as e:
         # 실제 Supabase 오류 내용을 함께 보여줘 원인을 바로 확인할 수 있게 한다.
         st.error(f"⚠️ 카드 저장에 실패했습니다.\n\n오류 내용: {e}")
-        return False
+        return None
 
 def update_card(card_id, category, front, back, front_img, back_img):
     try:
-        supabase.table(TABLE).update({
+        rows = supabase.table(TABLE).update({
             "category": category,
             "front": front,
             "back": back,
             "front_image_url": front_img,
             "back_image_url": back_img,
-        }).eq("id", card_id).execute()
+        }, returning=ReturnMethod.representation).eq("id", card_id).execute().data or []
+        card_store().apply_local(changed=rows)
+        card_fragments().invalidate(card_id)
+        card_search_index().touch([card_id])
         auto_backup()
-        clear_cards_cache()
-        return True
+        return rows
     except Exception:
         st.error("⚠️ 카드 수정에 실패했습니다. (Supabase 연결/정책/RLS/네트워크 확인)")
-        return False
+        return None
 
 def _storage_path_from_image_url(image_url: str):
     """flashcard-images 버킷의 public URL에서 Storage 내부 경로만 안전하게 추출한다."""
@@ -986,52 +3277,50 @@ def _delete_progress_for_card_ids(card_ids):
     # 없으면 기존 이름 목록이 사라질 수 있으므로 진행 기록을 보존한다.
     if not learners_table_available():
         return True
-    try:
-        for i in range(0, len(card_ids), 200):
-            supabase.table(PROGRESS_TABLE).delete().in_("card_id", card_ids[i:i+200]).execute()
-        return True
-    except Exception:
-        return False
+    return not bulk_delete_progress(card_ids)
 
 
 def delete_card(card_id):
-    """삭제 이미지는 휴지통에 보관하고, 카드 삭제 실패 시 이미지를 즉시 복원한다."""
+    """삭제 이미지는 휴지통에 보관하고, 카드 삭제 실패 시 이미지를 즉시 복원한다.
+    성공 시 삭제된 행 목록, 실패 시 None.
+    """
     try:
         rows = supabase.table(TABLE).select("id,front_image_url,back_image_url").eq("id", card_id).execute().data or []
     except Exception as e:
         st.error(f"⚠️ 삭제할 카드 정보를 읽지 못했습니다: {e}")
-        return False
+        return None
     if not rows:
         st.warning("이미 삭제되었거나 존재하지 않는 카드입니다.")
-        return False
+        card_store().apply_local(deleted_ids=[card_id])
+        return None
 
     row = rows[0]
     image_urls = [row.get("front_image_url"), row.get("back_image_url")]
     archive_ok, archived = _archive_image_paths(image_urls)
     if not archive_ok:
         st.error("⚠️ 이미지의 안전한 휴지통 이동에 실패하여 카드 삭제를 중단했습니다.")
-        return False
+        return None
 
     try:
-        supabase.table(TABLE).delete().eq("id", card_id).execute()
+        deleted = supabase.table(TABLE).delete(returning=ReturnMethod.representation).eq("id", card_id).execute().data or []
     except Exception as e:
         _restore_archived_paths(archived)
         st.error(f"⚠️ 카드 삭제에 실패해 이미지를 원래대로 복원했습니다: {e}")
-        return False
+        return None
 
+    card_store().apply_local(deleted_ids=[card_id])
+    record_card_tombstones([card_id])
     if not _delete_progress_for_card_ids([card_id]):
         st.warning("⚠️ 카드는 삭제됐지만 해당 카드의 오래된 학습 기록 일부를 정리하지 못했습니다.")
     auto_backup()
-    clear_cards_cache()
-    return True
+    return deleted
 
 
-def increment_wrong(card_id, current):
-    try:
-        supabase.table(TABLE).update({"wrong_count": int(current) + 1}).eq("id", card_id).execute()
-        clear_cards_cache()
-    except Exception:
+def increment_wrong(card_id, amount=1):
+    if increment_card_wrong_counts({card_id: amount}) is None:
         st.warning("⚠️ 오답 카운트 반영 실패 (네트워크/DB 상태 확인)")
+        return
+    clear_cards_cache()
 
 def reset_wrong(card_id):
     try:
@@ -1048,14 +3337,15 @@ def reset_wrong_by_category(category):
         st.warning("⚠️ 카테고리 오답 초기화 실패 (네트워크/DB 상태 확인)")
 
 def delete_category(category: str):
-    """카테고리 이미지를 휴지통에 보관한 뒤 카드와 해당 카드의 진행 기록을 안전하게 삭제한다."""
+    """카테고리 이미지를 휴지통에 보관한 뒤 카드와 해당 카드의 진행 기록을 안전하게 삭제한다.
+    성공 시 삭제된 행 목록, 실패 시 None.
+    """
     try:
         rows = supabase.table(TABLE).select("id,front_image_url,back_image_url").eq("category", category).execute().data or []
     except Exception as e:
         st.error(f"⚠️ 삭제할 카테고리 정보를 읽지 못했습니다: {e}")
-        return False
+        return None
 
-    card_ids = [r.get("id") for r in rows if r.get("id") is not None]
     image_urls = []
     for row in rows:
         image_urls.extend([row.get("front_image_url"), row.get("back_image_url")])
@@ -1063,31 +3353,36 @@ def delete_category(category: str):
     archive_ok, archived = _archive_image_paths(image_urls)
     if not archive_ok:
         st.error("⚠️ 이미지의 안전한 휴지통 이동에 실패하여 카테고리 삭제를 중단했습니다.")
-        return False
+        return None
 
     try:
-        supabase.table(TABLE).delete().eq("category", category).execute()
+        deleted = supabase.table(TABLE).delete(returning=ReturnMethod.representation).eq("category", category).execute().data or []
     except Exception as e:
         _restore_archived_paths(archived)
         st.error(f"⚠️ 카테고리 삭제에 실패해 이미지를 원래대로 복원했습니다: {e}")
-        return False
+        return None
 
+    # 조회와 삭제 사이에 추가된 카드도 함께 지워졌을 수 있으므로 실제 삭제 응답 기준으로 정리한다.
+    card_ids = [r.get("id") for r in deleted if r.get("id") is not None]
+    card_store().apply_local(deleted_ids=card_ids)
+    record_card_tombstones(card_ids)
     if not _delete_progress_for_card_ids(card_ids):
         st.warning("⚠️ 카테고리는 삭제됐지만 해당 카드의 오래된 학습 기록 일부를 정리하지 못했습니다.")
     auto_backup()
-    clear_cards_cache()
-    return True
+    return deleted
 
 
 def merge_category(from_cat: str, to_cat: str):
     try:
-        supabase.table(TABLE).update({"category": to_cat}).eq("category", from_cat).execute()
+        rows = supabase.table(TABLE).update(
+            {"category": to_cat}, returning=ReturnMethod.representation
+        ).eq("category", from_cat).execute().data or []
+        card_store().apply_local(changed=rows)
         auto_backup()
-        clear_cards_cache()
-        return True
+        return rows
     except Exception:
         st.error("⚠️ 카테고리 병합에 실패했습니다. (Supabase 연결/정책/RLS/네트워크 확인)")
-        return False
+        return None
 
 def list_backups(limit=30):
     try:
@@ -1159,8 +3454,13 @@ def restore_from_backup(filename: str):
         for i in range(0, len(ids), 200):
             supabase.table(TABLE).delete().in_("id", ids[i:i+200]).execute()
 
-        for i in range(0, len(cleaned), 200):
-            supabase.table(TABLE).insert(cleaned[i:i+200]).execute()
+        # updated_at은 DB 기본값(now())으로 새로 찍혀야 다른 세션의 증분 동기화가 복구된 카드를 받아간다.
+        to_insert = [{k: v for k, v in c.items() if k != "updated_at"} for c in cleaned]
+        for i in range(0, len(to_insert), 200):
+            supabase.table(TABLE).insert(to_insert[i:i+200]).execute()
+
+        restored_ids = {c.get("id") for c in cleaned}
+        record_card_tombstones([cid for cid in ids if cid not in restored_ids])
 
         if backup_progress is not None:
             supabase.table(PROGRESS_TABLE).delete().neq("learner", "").execute()
@@ -1179,8 +3479,7 @@ def restore_from_backup(filename: str):
         for p in backup_progress or []:
             if isinstance(p, dict) and p.get("learner"):
                 learner_names.add(normalize_learner_name(p["learner"]))
-        for name in learner_names:
-            register_learner(name)
+        register_learners(learner_names)
 
         auto_backup()
         clear_cards_cache()
@@ -1207,6 +3506,72 @@ def render_safe_text(s: str) -> str:
     s2 = "\n".join(cleaned)
     return html.escape(s2).replace("\n", "<br>")
 
+def render_card_html(label, text, img):
+    # 뒷면 텍스트가 비어 있는 PDF 카드는 빈 텍스트 영역 자체를 만들지 않는다.
+    # 따라서 답안 이미지만 있을 때 이미지가 불필요하게 아래로 밀리지 않는다.
+    text_html = (
+        f'<div class="flashcard-text">{render_safe_text(text)}</div>'
+        if (text or "").strip()
+        else ""
+    )
+    image_html = ""
+    if img:
+        safe_img_url = html.escape(str(img), quote=True)
+        image_html = (
+            f'<img src="{safe_img_url}" '
+            f'class="flashcard-image" alt="암기카드 이미지">'
+        )
+    return (
+        '<div class="flashcard">'
+        f'<div class="flashcard-label">{html.escape(label)}</div>'
+        f'{text_html}'
+        f'{image_html}'
+        '</div>'
+    )
+
+# =======================
+# 🧩 카드 HTML 조각 캐시
+# - 같은 카드를 다시 그릴 때마다(뒤집기, 위젯 조작, 다른 학습자의 같은 카드) 긴 본문을
+#   이스케이프하고 조립하지 않도록, 만든 HTML 조각을 프로세스 전체에서 함께 쓴다.
+# - 키는 (카드 id, 면/필드, 모드), 값에는 내용의 hash를 함께 둬서 내용이 바뀌면 다시 만든다.
+#   파이썬 str은 hash를 객체에 캐시하므로 같은 카드 dict를 쓰는 재실행에서는 hash 계산도 거의 공짜다.
+# - 조각은 CSS 변수만 쓰므로 테마(다크 모드)와 무관하다. 카드 수정 시에는 해당 카드 조각을 바로 버린다.
+# =======================
+CARD_FRAGMENT_CACHE = 2048
+
+
+class CardFragmentCache:
+    """LRU: dict 삽입 순서를 사용 순서로 쓴다 (조회할 때마다 맨 뒤로 다시 넣음)."""
+
+    def __init__(self, capacity=CARD_FRAGMENT_CACHE):
+        self._lock = threading.Lock()
+        self._items = {}  # key → (내용 hash, html)
+        self._capacity = capacity
+
+    def get(self, key, content, build):
+        digest = hash(content)
+        with self._lock:
+            hit = self._items.pop(key, None)
+            if hit is not None and hit[0] == digest:
+                self._items[key] = hit
+                return hit[1]
+        value = build()
+        with self._lock:
+            self._items[key] = (digest, value)
+            while len(self._items) > self._capacity:
+                self._items.pop(next(iter(self._items)))
+        return value
+
+    def invalidate(self, card_id):
+        with self._lock:
+            for key in [k for k in self._items if k[0] == card_id]:
+                del self._items[key]
+
+
+@st.cache_resource(show_spinner=False)
+def card_fragments():
+    return CardFragmentCache()
+
 # =======================
 # 세션 상태 (핵심 유지)
 # =======================
@@ -1215,46 +3580,524 @@ if "supabase_ok" not in st.session_state:
 
 if "cards" not in st.session_state:
     with st.spinner("Supabase에서 카드 불러오는 중..."):
-        data = cached_fetch_cards_safe()
-    st.session_state.cards = data if data is not None else []
+        data = card_store().get()
+    st.session_state.cards = data if data is not None else CardSnapshot([])
     st.session_state.supabase_ok = (data is not None)
 
 if "study_cards" not in st.session_state:
     st.session_state.study_cards = None
-if "index" not in st.session_state:
-    st.session_state.index = 0
+if "study_deck" not in st.session_state:
+    st.session_state.study_deck = None
 if "show_back" not in st.session_state:
     st.session_state.show_back = False
-if "order" not in st.session_state:
-    st.session_state.order = []
 if "upload_key" not in st.session_state:
     st.session_state.upload_key = 0
 
-if "study_filter_sig" not in st.session_state:
-    st.session_state.study_filter_sig = None
-
 # =======================
 # 공통
 # =======================
-def sync():
-    # 변경 직후에는 캐시를 비우고 최신을 받는다
-    clear_cards_cache()
+def sync(full=False):
+    # 변경 직후에는 공용 저장소가 바뀐 행만 받아 합치고, 증분 조회가 불가능하면 전체를 받는다
     with st.spinner("동기화 중..."):
-        data = cached_fetch_cards_safe()
+        data = card_store().get(full=full)
+    st.session_state.study_cards = None
     if data is None:
         st.session_state.supabase_ok = False
-        st.session_state.cards = []
-        st.session_state.study_cards = None
+        st.session_state.cards = CardSnapshot([])
         return
+    if data.full_load and data is not st.session_state.cards:
+        st.toast(f"🔄 카드 {len(data)}개를 새로 불러왔습니다")
     st.session_state.cards = data
+    st.session_state.supabase_ok = True
+
+def show_local_cards():
+    """쓰기 helper가 공용 저장소를 이미 고쳐 두었으므로 재조회·스피너 없이 화면만 최신 스냅샷으로 바꾼다."""
+    st.session_state.cards = card_store().snapshot or st.session_state.cards
+    st.session_state.study_cards = None
+
+def hydrate_cards(card_ids):
+    """아직 상세 컬럼이 없는 카드만 한 번에 받아 공용 저장소에 채운다. 네트워크 실패 시 있는 만큼만 쓴다."""
+    if st.session_state.get("offline"):
+        return card_store().cached_details(card_ids)
+    try:
+        return card_store().details(card_ids)
+    except Exception:
+        st.warning("⚠️ 카드 내용을 불러오지 못했습니다. (네트워크/DB 상태 확인)")
+        return {}
+
+def search_cards(cards, query, category=None, limit=None):
+    """검색 색인으로 찾은 카드 id 목록(관련도 순). category가 None이면 전체 카테고리에서 찾는다."""
+    index = card_search_index()
+    fetch = not st.session_state.get("offline")
+    if len(index):
+        index.sync(cards, fetch=fetch)
+    else:
+        with st.spinner("검색 색인을 만드는 중..."):
+            index.sync(cards, fetch=fetch)
+    return index.search(query, category=category, limit=limit)
+
+class StudyDeck:
+    """암기 모드에서 지금 넘겨 보는 카드 묶음. 필터(sig)나 카드 스냅샷이 바뀔 때만 새로 만든다.
+    순서(id 목록), 지금 위치, id → 위치 사전을 함께 들고 있어 넘기기·건너뛰기가 카드 수와 관계없이 O(1)이다.
+    카드 행은 만든 시점의 스냅샷(source)에서 바로 꺼낸다.
+    """
+
+    def __init__(self, sig, source, ids, shuffle=False):
+        self.sig = sig
+        self.source = source
+        self.order = list(ids)
+        if shuffle:
+            random.shuffle(self.order)
+        self._pos = {cid: i for i, cid in enumerate(self.order)}
+        self.position = 0
+        self.uid = uuid.uuid4().hex  # 빠른 넘기기 컴포넌트가 보낸 결과가 어느 덱 기준인지 가리는 데 쓴다
+        self.stale = False  # 오답 초기화처럼 카드 구성이 바뀌었을 수 있을 때 다음 rerun에서 다시 만든다
+
+    def __len__(self):
+        return len(self.order)
+
+    @property
+    def current_id(self):
+        return self.order[self.position] if self.order else None
+
+    def card(self, card_id=None):
+        return self.source.get(self.current_id if card_id is None else card_id)
+
+    def advance(self, step=1):
+        if self.order:
+            self.position = (self.position + step) % len(self.order)
+
+    def jump(self, card_id):
+        pos = self._pos.get(card_id)
+        if pos is None:
+            return False
+        self.position = pos
+        return True
+
+    def upcoming(self, n):
+        """지금 카드 다음부터 n장의 id."""
+        size = len(self.order)
+        return [self.order[(self.position + k) % size] for k in range(1, min(n, size - 1) + 1)]
+
+    def shuffle(self):
+        random.shuffle(self.order)
+        self._pos = {cid: i for i, cid in enumerate(self.order)}
+        self.position = 0
+        self.uid = uuid.uuid4().hex
+
+    def carry_over(self, previous):
+        """같은 필터로 다시 만든 덱이 이전 덱의 순서와 지금 카드를 이어받게 한다.
+        남아 있는 카드는 이전 순서대로, 새로 들어온 카드는 뒤에 붙인다.
+        """
+        kept = [cid for cid in previous.order if cid in self._pos]
+        kept_set = set(kept)
+        self.order = kept + [cid for cid in self.order if cid not in kept_set]
+        self._pos = {cid: i for i, cid in enumerate(self.order)}
+        if not self.jump(previous.current_id):
+            self.position = min(previous.position, max(len(self.order) - 1, 0))
+
+# =======================
+# ⚡ 빠른 넘기기 (브라우저 컴포넌트)
+# - 카드를 뒤집거나 넘길 때마다 전체 rerun을 하지 않도록, 다음 STUDY_FLIP_WINDOW장을 한꺼번에
+#   flashcard_component/index.html 로 보내고 뒤집기·넘기기·Enter 키는 브라우저에서 처리한다.
+# - 컴포넌트는 답할 때마다 아직 ack를 받지 못한 채점 결과를 번호(n)와 함께 전부 보내고,
+#   파이썬은 (token, n)으로 한 번만 반영한 뒤 ack와 함께 다음 묶음을 보낸다.
+#   메뉴를 옮기거나 토글을 끄면 컴포넌트가 바로 사라지므로 브라우저에 결과를 모아 두지 않는다.
+# =======================
+FLIP_COMPONENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flashcard_component")
+STUDY_FLIP_WINDOW = 20
+
+_flip_component = components.declare_component("flashcard_flip", path=FLIP_COMPONENT_DIR)
+
+
+def pending_flip_reviews():
+    """아직 반영하지 않은 컴포넌트 채점 결과 [{n, id, wrong, deck}]. 이미 반영한 번호는 빠진다."""
+    batch = st.session_state.get("study_flip")
+    ack = st.session_state.get("study_flip_ack") or {}
+    if not isinstance(batch, dict):
+        return []
+    done = (ack.get("seq") or 0) if batch.get("token") == ack.get("token") else 0
+    return [r for r in batch.get("reviews") or [] if (r.get("n") or 0) > done]
+
+
+def ack_flip_reviews():
+    batch = st.session_state.get("study_flip") or {}
+    st.session_state.study_flip_ack = {"token": batch.get("token"), "seq": batch.get("seq") or 0}
+
+
+def mark_reviewed(card_id, mark_wrong=False):
+    """암기 모드에서 카드 하나를 본 결과를 오답 기록·복습 일정·저장 대기열에 반영한다."""
+    progress_map = st.session_state.progress_map
+    cur = progress_map.wrong_count(card_id)
+    now_iso = datetime.utcnow().isoformat()
+    progress_map.set(card_id, cur + 1 if mark_wrong else cur, now_iso)
+    # 스케줄 컬럼이 없는 설치에서는 이번 세션 안에서만 간격 반복 순서를 따른다.
+    schedule = sm2_next(st.session_state.schedule_map.get(card_id), not mark_wrong, datetime.now(timezone.utc))
+    st.session_state.schedule_map[card_id] = schedule
+    if st.session_state.get("due_queue") is not None:
+        st.session_state.due_queue.push(card_id, due_timestamp(schedule))
+    card_row = st.session_state.study_cards.get(card_id) if st.session_state.study_cards is not None else None
+    queue_progress(
+        st.session_state.learner, card_id, 1 if mark_wrong else 0, now_iso, schedule,
+        category=(card_row or {}).get("category") or "",
+    )
+
+
+def apply_flip_reviews():
+    """컴포넌트가 보낸 채점 묶음을 반영하고 ack한다. 브라우저에서 넘긴 만큼 덱 위치도 맞춘다.
+    빠른 넘기기를 끄거나 다른 메뉴로 옮긴 실행에 도착한 묶음도 버리지 않도록 메뉴·토글과 관계없이 매 실행 부른다.
+    """
+    reviews = pending_flip_reviews()
+    if not reviews or "progress_map" not in st.session_state:
+        return
+    cards = st.session_state.study_cards or st.session_state.cards
+    deck = st.session_state.get("study_deck")
+    for review in reviews:
+        if cards.get(review.get("id")) is None:
+            continue
+        mark_reviewed(review["id"], mark_wrong=bool(review.get("wrong")))
+        if deck is not None and review.get("deck") == deck.uid and deck.jump(review["id"]):
+            deck.advance()
+    ack_flip_reviews()
+
+
+def _flip_text_html(cid, field, card):
+    text = card.get(field) or ""
+    return card_fragments().get((cid, f"{field}_text"), text, lambda: render_safe_text(text))
+
+
+def render_flip_window(deck, recall_mode, enter_only):
+    """지금 위치부터 STUDY_FLIP_WINDOW장을 컴포넌트로 보낸다."""
+    ids = [deck.current_id] + deck.upcoming(STUDY_FLIP_WINDOW - 1)
+    hydrate_cards(ids)
+    first, second = ("back", "front") if recall_mode else ("front", "back")
+    window = []
+    for cid in ids:
+        card = full_card(deck.card(cid))
+        window.append({
+            "id": cid,
+            "wrong": st.session_state.progress_map.wrong_count(cid),
+            "first_html": _flip_text_html(cid, first, card),
+            "second_html": _flip_text_html(cid, second, card),
+            "first_img": card.get(f"{first}_image_url"),
+            "second_img": card.get(f"{second}_image_url"),
+        })
+        # 미리 받기 예산은 컴포넌트가 자기 위치 기준으로 계산한다.
+        for side in ("first", "second"):
+            url = window[-1][f"{side}_img"]
+            window[-1][f"{side}_img_bytes"] = image_size(url) if url else 0
+    ack = st.session_state.get("study_flip_ack") or {}
+    _flip_component(
+        cards=window,
+        position=deck.position,
+        total=len(deck),
+        deck_uid=deck.uid,
+        # 결과를 반영할 때마다 달라져야 덱을 한 바퀴 돌아 같은 위치로 와도 새 묶음으로 알아본다.
+        window_id=f"{deck.uid}:{deck.position}:{ack.get('token')}:{ack.get('seq', 0)}",
+        ack=ack,
+        first_label="설명" if recall_mode else "문제",
+        second_label="개념" if recall_mode else "정답",
+        enter_only=bool(enter_only),
+        prefetch_ahead=IMAGE_PREFETCH_AHEAD,
+        prefetch_budget=IMAGE_PREFETCH_BUDGET,
+        theme=_vars,
+        key="study_flip",
+        default=None,
+    )
+
+# =======================
+# 🖼️ 이미지 미리 받기
+# - 뒤집거나 넘길 때 Storage 이미지를 그제야 받느라 빈 화면이 보이지 않도록,
+#   지금 카드의 다음 면과 다음 IMAGE_PREFETCH_AHEAD장의 이미지를 브라우저 캐시에 미리 받아 둔다.
+# - 350dpi PDF 크롭처럼 큰 이미지가 많으므로 합계가 IMAGE_PREFETCH_BUDGET을 넘지 않게 고른다.
+#   이미지 크기는 HEAD 요청으로 백그라운드에서 알아 두고, 아직 모르면 IMAGE_SIZE_GUESS로 어림한다.
+# - HEAD는 공용 클라이언트(supabase_http)로 보내 재시도·서킷 브레이커·호출 계측을 함께 받는다.
+#   Supabase 밖의 이미지 URL은 서킷 브레이커에 남의 장애가 섞이지 않도록 확인하지 않고 어림값을 쓴다.
+# =======================
+IMAGE_PREFETCH_AHEAD = 5
+IMAGE_PREFETCH_BUDGET = 6 * 1024 * 1024
+IMAGE_SIZE_GUESS = 512 * 1024
+IMAGE_SIZE_CACHE_MAX = 10000
+
+
+class ImageSizeCache:
+    """이미지 URL → 바이트 수. 모르는 URL은 백그라운드에서 HEAD로 알아 오고 그동안은 None."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sizes = {}
+        self._inflight = set()
+        self._pool = ThreadPoolExecutor(max_workers=2)
+        self._http = supabase_http()
+        self._host = urlparse(SUPABASE_URL).netloc
+
+    def get(self, url):
+        with self._lock:
+            size = self._sizes.get(url)
+            if size is not None or url in self._inflight:
+                return size
+            self._inflight.add(url)
+        self._pool.submit(self._head, url)
+        return None
+
+    def _head(self, url):
+        size = 0
+        if urlparse(str(url)).netloc == self._host:
+            try:
+                res = self._http.head(url)
+                size = int(res.headers.get("content-length") or 0) if res.status_code < 400 else 0
+            except Exception:
+                pass
+        with self._lock:
+            self._inflight.discard(url)
+            if len(self._sizes) >= IMAGE_SIZE_CACHE_MAX:
+                self._sizes.pop(next(iter(self._sizes)))
+            self._sizes[url] = size or IMAGE_SIZE_GUESS
+
+
+@st.cache_resource(show_spinner=False)
+def image_sizes():
+    return ImageSizeCache()
+
+
+def image_size(url):
+    """미리 받기 예산 계산용 크기. 아직 모르면 어림값."""
+    return image_sizes().get(url) or IMAGE_SIZE_GUESS
+
+
+def pick_prefetch_images(urls, budget=IMAGE_PREFETCH_BUDGET):
+    """우선순위 순 URL 중 합계가 예산 안에 드는 것만 고른다. 큰 이미지 하나 때문에 뒤의 작은 이미지를 버리지 않는다."""
+    picked, used = [], 0
+    for url in dict.fromkeys(u for u in urls if u):
+        size = image_size(url)
+        if used + size <= budget:
+            picked.append(url)
+            used += size
+    return picked
+
+
+def study_prefetch_urls(deck, card, recall_mode, show_back, upcoming):
+    """미리 받을 이미지 URL을 우선순위 순으로: 지금 카드의 다음 면 → 다음 카드들의 앞면·뒷면."""
+    sides = ("back", "front") if recall_mode else ("front", "back")
+    urls = [] if show_back else [card.get(f"{sides[1]}_image_url")]
+    for cid in upcoming[:IMAGE_PREFETCH_AHEAD]:
+        nxt = deck.card(cid)
+        if nxt is not None:
+            nxt = full_card(nxt)
+            urls += [nxt.get(f"{sides[0]}_image_url"), nxt.get(f"{sides[1]}_image_url")]
+    return pick_prefetch_images(urls)
+
+
+def render_image_prefetch(urls):
+    """보이지 않는 img로 미리 받는다. (link rel=prefetch와 달리 보일 때와 같은 방식으로 캐시에 들어간다)"""
+    return "".join(
+        f'<img src="{html.escape(str(url), quote=True)}" class="img-prefetch" alt="" aria-hidden="true" decoding="async">'
+        for url in urls
+    )
+
+def render_search_everywhere(key, cards, pick_label, on_pick):
+    """모든 카테고리를 관련도 순으로 찾는 검색 상자. 결과 옆 버튼을 누르면 on_pick(card_id)을 부른다.
+    on_pick은 버튼 콜백으로 실행되므로 다음 rerun에서 위젯이 그려지기 전에 선택 상태를 바꿀 수 있다.
+    """
+    q = st.text_input(
+        "🌐 전체 검색",
+        key=key,
+        placeholder="모든 카테고리에서 관련도 순으로 찾기 (앞면 일치가 먼저)",
+    ).strip()
+    if not q:
+        return
+    hits = search_cards(cards, q, limit=SEARCH_EVERYWHERE_LIMIT)
+    if not hits:
+        st.caption("검색 결과가 없습니다.")
+        return
+    hydrate_cards(hits)
+    for cid in hits:
+        card = full_card(cards.get(cid))
+        bg, fg = category_color(card.get("category") or "")
+        back = re.sub(r"\s+", " ", card.get("back") or "").strip()
+        r1, r2 = st.columns([5, 1])
+        with r1:
+            st.markdown(
+                f'<span class="cat-chip" style="background:{bg};color:{fg};">{html.escape(card.get("category") or "")}</span> '
+                f'{html.escape(card.get("front") or "(앞면 없음)")}',
+                unsafe_allow_html=True,
+            )
+            if back:
+                st.caption(back[:80] + ("…" if len(back) > 80 else ""))
+        with r2:
+            st.button(pick_label, key=f"{key}_pick_{cid}", on_click=on_pick, args=(cid,))
+
+def full_card(card):
+    """색인 행에 상세 컬럼을 합친 카드. 상세를 아직 받지 않았으면 색인 행 그대로."""
+    detail = card_store().detail(card.get("id"))
+    return {**card, **detail} if detail else card
+
+def go_offline():
+    """로컬 스냅샷으로 오프라인 학습을 시작한다. 아직 못 보낸 버퍼도 저널로 옮긴다."""
+    snap = load_offline_cards()
+    if snap is None:
+        return False
+    rows, details, _ = snap
+    card_store().seed_details(details)
+    pending = st.session_state.progress_pending
+    append_offline_reviews([(learner, cid, *d, None) for (learner, cid), d in pending.items()])
+    st.session_state.progress_pending = {}
+    st.session_state.progress_pending_since = None
+    st.session_state.offline = True
+    st.session_state.cards = CardSnapshot(rows)
     st.session_state.study_cards = None
+    st.session_state.progress_loaded_for = None
+    return True
+
+def try_go_online():
+    """오프라인 중 연결이 돌아왔는지 가볍게 확인하고, 돌아왔으면 최신 카드와 진행 기록으로 바꾼다."""
+    if card_store().current_revision() is None:
+        return False
+    data = card_store().get()
+    if data is None:
+        return False
+    st.session_state.offline = False
     st.session_state.supabase_ok = True
+    schema_capabilities().retry_unknown()
+    st.session_state.cards = data
+    st.session_state.study_cards = None
+    st.session_state.progress_loaded_for = None
+    return True
+
+def refresh_cards_if_stale():
+    """다른 세션의 쓰기로 카드 리비전이 바뀌었으면 이 세션이 보는 스냅샷을 최신으로 바꾼다.
+    전체 동기화와 달리 암기 모드의 현재 순서(study_cards)는 건드리지 않는다.
+    """
+    data = card_store().get()
+    if data is not None:
+        st.session_state.cards = data
+
+# =======================
+# ✍️ 진행 기록 쓰기 버퍼 (write-behind)
+# - 정답/오답을 누를 때마다 DB에 바로 쓰지 않고 progress_map만 즉시 고친 뒤
+#   세션 버퍼에 카드별 "오답 증가분 + 마지막 학습 시각"으로 모아 두었다가 한 번에 저장한다.
+# - 저장은 increment_progress(원자적 증가 RPC)로 하므로 다른 탭의 기록과 덮어쓰지 않고 더해진다.
+# - 저장 시점: 버퍼가 PROGRESS_FLUSH_EVERY장 쌓였을 때, 첫 기록 후 PROGRESS_FLUSH_SECONDS초가
+#   지났을 때, 메뉴를 바꿀 때, 학습자를 전환할 때.
+# - 실패하면 증분을 버퍼에 되돌려 두고 점점 간격을 늘려 다시 시도한다.
+# =======================
+PROGRESS_FLUSH_EVERY = 10
+PROGRESS_FLUSH_SECONDS = 5.0
+PROGRESS_FLUSH_MAX_BACKOFF = 60.0
+
+if "progress_pending" not in st.session_state:
+    st.session_state.progress_pending = {}
+if "progress_pending_since" not in st.session_state:
+    st.session_state.progress_pending_since = None
+if "progress_flush_failures" not in st.session_state:
+    st.session_state.progress_flush_failures = 0
+if "progress_flush_retry_at" not in st.session_state:
+    st.session_state.progress_flush_retry_at = 0.0
+if "review_events_pending" not in st.session_state:
+    st.session_state.review_events_pending = []
+
+def _merge_pending(pending, key, wrong_delta, reviewed_at, schedule=None):
+    """버퍼 항목은 (오답 증가분, 마지막 학습 시각, 스케줄 상태). 증가분은 더하고 나머지는 최신 값을 남긴다."""
+    prev = pending.get(key)
+    if prev is None:
+        pending[key] = (wrong_delta, reviewed_at, schedule)
+    else:
+        pending[key] = (prev[0] + wrong_delta, max(prev[1], reviewed_at), schedule or prev[2])
+
+def queue_progress(learner, card_id, wrong_delta, reviewed_at, schedule=None, category=None):
+    """학습 한 번을 버퍼에 넣고, 조건이 되면 바로 저장한다. 오프라인이면 로컬 저널에 남긴다.
+    category를 주면 통계용 리뷰 이벤트도 함께 쌓는다.
+    """
+    if st.session_state.get("offline"):
+        if not append_offline_reviews([(learner, card_id, wrong_delta, reviewed_at, schedule, category)]):
+            st.warning("⚠️ 오프라인 학습 기록을 로컬 저널에 남기지 못했습니다. (OFFLINE_DIR 쓰기 권한 확인)")
+        return
+    _merge_pending(st.session_state.progress_pending, (normalize_learner_name(learner), card_id), wrong_delta, reviewed_at, schedule)
+    if category is not None:
+        st.session_state.review_events_pending.append(
+            make_review_event(learner, card_id, category, not wrong_delta, datetime.now(timezone.utc).isoformat())
+        )
+    if st.session_state.progress_pending_since is None:
+        st.session_state.progress_pending_since = time.monotonic()
+    flush_progress()
+
+def discard_pending_progress(learner, card_ids):
+    """초기화할 카드의 미저장 기록을 버려, 나중 flush가 지운 기록을 되살리지 않게 한다."""
+    learner = normalize_learner_name(learner)
+    for cid in card_ids:
+        st.session_state.progress_pending.pop((learner, cid), None)
+
+def flush_progress(force=False):
+    """버퍼에 쌓인 진행 기록을 저장한다. force=True면 개수·시간 조건과 재시도 대기를 무시한다.
+    반환값: 버퍼가 비었으면 True, 남아 있으면 False
+    """
+    pending = st.session_state.progress_pending
+    if not pending and not st.session_state.review_events_pending:
+        st.session_state.progress_pending_since = None
+        return True
+    now = time.monotonic()
+    if not force:
+        if now < st.session_state.progress_flush_retry_at:
+            return False
+        due = now - (st.session_state.progress_pending_since or now) >= PROGRESS_FLUSH_SECONDS
+        if len(pending) < PROGRESS_FLUSH_EVERY and not due:
+            return False
+
+    by_learner = {}
+    for (learner, cid), delta in pending.items():
+        by_learner.setdefault(learner, {})[cid] = delta
+    st.session_state.progress_pending = {}
+
+    failed = {}
+    for learner, deltas in by_learner.items():
+        rows = increment_progress(learner, {cid: d[:2] for cid, d in deltas.items()})
+        if rows is None:
+            failed.update({(learner, cid): d for cid, d in deltas.items()})
+            continue
+        # 스케줄은 절대값이라 증가분과 따로 저장한다. 실패하면 증가분 없이 스케줄만 다시 보낸다.
+        schedules = [
+            {"learner": learner, "card_id": cid, **d[2]}
+            for cid, d in deltas.items() if d[2]
+        ]
+        if schedules and has_capability("progress_schedule") and not upsert_progress_rows(schedules):
+            failed.update({(learner, r["card_id"]): (0, deltas[r["card_id"]][1], deltas[r["card_id"]][2]) for r in schedules})
+        # DB가 돌려준 최종 값(다른 탭에서 더한 몫 포함)으로 화면의 기록을 맞춘다.
+        progress_map = st.session_state.get("progress_map")
+        if progress_map is not None and learner == normalize_learner_name(st.session_state.get("learner")):
+            progress_map.update_rows(rows)
+        _fetch_progress_rollup.clear(learner)
+
+    events = st.session_state.review_events_pending
+    events_ok = insert_review_events(events)
+    if events_ok:
+        st.session_state.review_events_pending = []
+
+    if not failed and events_ok:
+        st.session_state.progress_flush_failures = 0
+        st.session_state.progress_flush_retry_at = 0.0
+        st.session_state.progress_pending_since = None
+        return True
+
+    for key, (wrong_delta, reviewed_at, schedule) in failed.items():
+        _merge_pending(st.session_state.progress_pending, key, wrong_delta, reviewed_at, schedule)
+    st.session_state.progress_pending_since = now
+    st.session_state.progress_flush_failures += 1
+    backoff = min(PROGRESS_FLUSH_MAX_BACKOFF, 2 ** st.session_state.progress_flush_failures)
+    st.session_state.progress_flush_retry_at = now + backoff
+    if force or st.session_state.progress_flush_failures >= 3:
+        st.warning(f"⚠️ 학습 기록 {len(failed) or len(events)}건을 아직 저장하지 못했습니다. 잠시 후 자동으로 다시 시도합니다. (flashcard_progress 테이블/네트워크 확인)")
+    return False
+
+@st.fragment(run_every=PROGRESS_FLUSH_SECONDS)
+def _progress_flush_timer():
+    """화면을 다시 그리지 않고 주기적으로 버퍼를 비운다. (버튼을 누르지 않고 멈춰 있을 때 대비)"""
+    flush_progress()
 
 def categories(cards):
-    return sorted({c["category"] for c in cards if c.get("category") is not None})
+    return cards.category_names
 
 def count_by_category(cards, category):
-    return sum(1 for c in cards if c.get("category") == category)
+    return cards.count(category)
 
 # =======================
 # 헤더 & Supabase 연결 실패 방어막
@@ -1297,26 +4140,68 @@ else:
         st.caption(f"👤 현재 학습자: **{st.session_state.learner}**")
     with hc2:
         if st.button("전환", use_container_width=True):
+            flush_progress(force=True)
             st.session_state.learner = None
-            st.session_state.progress_map = {}
+            st.session_state.progress_map = CompactProgressMap()
+            st.session_state.progress_loaded_for = None
             st.rerun()
 
-if not st.session_state.supabase_ok:
-    st.error("⚠️ Supabase 프로젝트가 잠들어 있거나(Paused), 깨는 중이거나 네트워크 문제로 연결에 실패했습니다.\n\nSupabase에서 Resume 후 아래 버튼을 눌러주세요.")
+if "offline" not in st.session_state:
+    st.session_state.offline = False
+
+if not st.session_state.supabase_ok and not st.session_state.offline:
+    if supabase_health() in ("slow", "degraded"):
+        st.warning("⏳ Supabase 응답이 일시적으로 느려 카드를 불러오지 못했습니다.\n\n잠시 후 아래 버튼을 눌러 다시 시도해주세요.")
+    else:
+        st.error("⚠️ Supabase 프로젝트가 잠들어 있거나(Paused), 깨는 중이거나 네트워크 문제로 연결에 실패했습니다.\n\nSupabase에서 Resume 후 아래 버튼을 눌러주세요.")
     if st.button("🔄 다시 시도"):
+        circuit_breaker().reset()
+        refresh_schema_capabilities()
         clear_cards_cache()
         with st.spinner("다시 시도 중..."):
-            data = cached_fetch_cards_safe()
+            data = card_store().get(full=True)
         if data is not None:
             st.session_state.cards = data
             st.session_state.supabase_ok = True
         st.rerun()
+    offline_snap = load_offline_cards()
+    if offline_snap is not None:
+        saved_at = offline_snap[2]
+        saved_label = datetime.fromisoformat(saved_at).astimezone(KST).strftime("%m/%d %H:%M") if saved_at else "-"
+        st.caption(f"마지막으로 저장된 카드 {len(offline_snap[0])}장(저장 시각 {saved_label})으로 암기 모드를 계속할 수 있습니다.")
+        if st.button("📴 오프라인으로 계속 학습"):
+            go_offline()
+            st.rerun()
     st.stop()
 
+if st.session_state.offline:
+    if try_go_online():
+        st.toast("🔌 Supabase에 다시 연결되었습니다")
+    else:
+        st.info(f"📴 오프라인 학습 중 · 저장 대기 기록 {pending_offline_reviews()}건 (연결되면 자동으로 저장됩니다)")
+
+if not st.session_state.offline:
+    replayed = replay_offline_journal()
+    if replayed:
+        st.toast(f"📤 오프라인 학습 기록 {replayed}건을 저장했습니다")
+    refresh_cards_if_stale()
+
 # =======================
 # 메뉴
 # =======================
-page = st.radio("", ["➕ 카드 입력", "🧠 암기 모드", "🛠️ 카드 관리", "📄 PDF 가져오기"], horizontal=True)
+page = st.radio("", ["➕ 카드 입력", "🧠 암기 모드", "🛠️ 카드 관리", "📄 PDF 가져오기", "📊 학습 통계"], horizontal=True)
+
+# 빠른 넘기기 결과는 어느 메뉴에서 도착해도 먼저 반영해, 암기 모드를 떠날 때 함께 저장되게 한다.
+apply_flip_reviews()
+
+# 암기 모드를 떠나면 모아 둔 학습 기록을 바로 저장한다.
+if st.session_state.get("last_page") != page:
+    flush_progress(force=True)
+    st.session_state.last_page = page
+
+if st.session_state.offline and page != "🧠 암기 모드":
+    st.info("📴 오프라인 중에는 암기 모드만 사용할 수 있습니다. 연결이 돌아오면 다른 메뉴도 다시 열립니다.")
+    st.stop()
 
 # =======================
 # 카드 저장 (form 대응)
@@ -1337,14 +4222,13 @@ def save_card_fast():
     front_img = upload_image(front_file, "front") if front_file else None
     back_img = upload_image(back_file, "back") if back_file else None
 
-    ok = insert_card(cat, front, back, front_img, back_img)
-    if not ok:
+    if insert_card(cat, front, back, front_img, back_img) is None:
         return
 
     st.session_state.upload_key += 1
     st.session_state.input_front = ""
     st.session_state.input_back = ""
-    sync()
+    show_local_cards()
     st.rerun()
 
 # =======================
@@ -1375,32 +4259,38 @@ elif page == "🧠 암기 모드":
         st.stop()
 
     if st.session_state.study_cards is None:
-        st.session_state.study_cards = st.session_state.cards.copy()
-        st.session_state.index = 0
+        # 스냅샷은 읽기 전용 공유 객체이므로 복사하지 않고 참조만 고정해 둔다.
+        st.session_state.study_cards = st.session_state.cards
         st.session_state.show_back = False
-        st.session_state.order = []
 
     if "progress_map" not in st.session_state:
-        st.session_state.progress_map = {}
+        st.session_state.progress_map = CompactProgressMap()
+    if "schedule_map" not in st.session_state:
+        st.session_state.schedule_map = {}
+    if "due_queue" not in st.session_state:
+        st.session_state.due_queue = None
     if "progress_loaded_for" not in st.session_state:
         st.session_state.progress_loaded_for = None
     if st.session_state.progress_loaded_for != st.session_state.learner:
-        st.session_state.progress_map = fetch_progress_map(st.session_state.learner)
+        if st.session_state.offline:
+            st.session_state.progress_map, st.session_state.schedule_map = load_offline_progress(st.session_state.learner)
+        else:
+            progress_map = fetch_progress_map(st.session_state.learner, strict=True)
+            schedule_map = fetch_schedule_map(st.session_state.learner, strict=True)
+            if progress_map is None or schedule_map is None:
+                # 조회에 실패하면 마지막 로컬 스냅샷으로 보여주고, 그 스냅샷을 빈 기록으로 덮어쓰지 않는다.
+                saved_progress, saved_schedule = load_offline_progress(st.session_state.learner)
+                progress_map = saved_progress if progress_map is None else progress_map
+                schedule_map = saved_schedule if schedule_map is None else schedule_map
+            else:
+                save_offline_progress(st.session_state.learner, progress_map, schedule_map)
+            st.session_state.progress_map = progress_map
+            st.session_state.schedule_map = schedule_map
+        st.session_state.due_queue = None
         st.session_state.progress_loaded_for = st.session_state.learner
 
     def _learner_wrong(card_id):
-        p = st.session_state.progress_map.get(card_id)
-        return int(p["wrong_count"]) if p else 0
-
-    def _mark_reviewed(card_id, mark_wrong=False):
-        cur = _learner_wrong(card_id)
-        new_wrong = cur + 1 if mark_wrong else cur
-        now_iso = datetime.utcnow().isoformat()
-        upsert_progress(st.session_state.learner, card_id, new_wrong, now_iso)
-        st.session_state.progress_map[card_id] = {
-            "learner": st.session_state.learner, "card_id": card_id,
-            "wrong_count": new_wrong, "last_reviewed_at": now_iso,
-        }
+        return st.session_state.progress_map.wrong_count(card_id)
 
     cards = st.session_state.study_cards
     cat_list = categories(cards)
@@ -1408,7 +4298,25 @@ elif page == "🧠 암기 모드":
         st.warning("카테고리가 없습니다. 카드 입력에서 카테고리를 먼저 추가하세요.")
         st.stop()
 
-    cat = st.selectbox("카테고리", cat_list)
+    def _jump_to_card(card_id):
+        card_row = cards.get(card_id)
+        if card_row is None:
+            return
+        # 고른 카드가 필터에 걸려 빠지지 않도록 카테고리 안의 기본 보기로 돌아간다.
+        st.session_state.study_category = card_row.get("category")
+        st.session_state.study_search_q = ""
+        st.session_state.study_wrong_only = False
+        if st.session_state.get("study_order_mode") == DUE_ORDER_MODE:
+            st.session_state.study_order_mode = "➡️ 기본순"
+        st.session_state.study_jump_to = card_id
+
+    with st.expander("🌐 전체 카테고리에서 찾기"):
+        render_search_everywhere("study_search_all_q", cards, "📖 학습", _jump_to_card)
+
+    rollup = fetch_category_rollup(st.session_state.learner, cards, st.session_state.progress_map)
+    cat = st.selectbox(
+        "카테고리", cat_list, format_func=lambda c: category_badge_label(c, rollup), key="study_category"
+    )
     _chip_bg, _chip_fg = category_color(cat)
     st.markdown(
         f'<span class="cat-chip" style="background:{_chip_bg};color:{_chip_fg};">{html.escape(cat)}</span>',
@@ -1419,166 +4327,180 @@ elif page == "🧠 암기 모드":
     with c1:
         order_mode = st.selectbox(
             "정렬",
-            ["🔀 랜덤", "➡️ 기본순"],
+            ["🔀 랜덤", "➡️ 기본순", DUE_ORDER_MODE],
             key="study_order_mode",
         )
     with c2:
-        wrong_only = st.checkbox("❗ 오답만")
+        wrong_only = st.checkbox("❗ 오답만", key="study_wrong_only")
     with c3:
         enter_only = st.checkbox("⌨️ 엔터 온리", value=True)
     with c4:
         recall_mode = st.checkbox("🧠 회상 모드")
 
     st.caption("회상 모드: 설명을 보고 해당 개념을 떠올리는 연습")
+    fast_flip = st.toggle(
+        "⚡ 빠른 넘기기",
+        key="study_fast_flip",
+        disabled=order_mode == DUE_ORDER_MODE,
+        help="뒤집기/넘기기를 브라우저에서 바로 처리하고 채점 결과만 모아서 저장합니다. (복습할 카드 순서에서는 쓸 수 없음)",
+    ) and order_mode != DUE_ORDER_MODE
 
     q = st.text_input(
         "🔎 검색",
         key="study_search_q",
-        placeholder="앞면/뒷면에서 키워드로 찾기 (예: CRC, 오스테나이트, 서브넷)",
+        placeholder="앞면/뒷면에서 키워드나 초성으로 찾기 (예: CRC, 오스테나이트, ㅅㅂㄴ)",
     ).strip().lower()
 
     filter_sig = (cat, order_mode, bool(wrong_only), bool(enter_only), bool(recall_mode), q, st.session_state.learner)
-    if st.session_state.study_filter_sig is None:
-        st.session_state.study_filter_sig = filter_sig
-    elif st.session_state.study_filter_sig != filter_sig:
-        st.session_state.study_filter_sig = filter_sig
-        st.session_state.index = 0
-        st.session_state.show_back = False
-        st.session_state.order = []
-
-    base = [c for c in cards if c.get("category") == cat]
-    if wrong_only:
-        base = [c for c in base if _learner_wrong(c["id"]) > 0]
-
-    if q:
-        base = [
-            c for c in base
-            if (q in (c.get("front") or "").lower()) or (q in (c.get("back") or "").lower())
-        ]
-
-    if not base:
-        st.info("표시할 카드가 없습니다." if not q else "검색 결과가 없습니다. 다른 키워드로 시도해보세요.")
-        st.stop()
+    deck = st.session_state.study_deck
+    # 필터나 고정해 둔 카드 스냅샷이 바뀌었을 때만 카드를 다시 고른다. 카드를 넘길 때는 덱 위치만 바뀐다.
+    if deck is None or deck.stale or deck.sig != filter_sig or deck.source is not cards:
+        base = cards.in_category(cat)
+        if wrong_only:
+            base = [c for c in base if _learner_wrong(c["id"]) > 0]
+        if q:
+            # 관련도 순으로 받아 오므로 기본순으로 볼 때는 가장 잘 맞는 카드부터 나온다.
+            allowed = {c["id"] for c in base}
+            base = [cards.get(cid) for cid in search_cards(cards, q, category=cat) if cid in allowed]
+        ids = [c["id"] for c in base if c.get("id") is not None]
+        new_deck = StudyDeck(filter_sig, cards, ids, shuffle=order_mode == "🔀 랜덤")
+        if deck is not None and deck.sig == filter_sig:
+            new_deck.carry_over(deck)
+        else:
+            st.session_state.show_back = False
+        deck = st.session_state.study_deck = new_deck
 
-    ids = [c["id"] for c in base if c.get("id") is not None]
-    if not ids:
-        st.info("표시할 카드가 없습니다.")
+    if not len(deck):
+        st.info("검색 결과가 없습니다. 다른 키워드로 시도해보세요." if q else "표시할 카드가 없습니다.")
         st.stop()
 
     if order_mode == "🔀 랜덤":
         if st.button("🔄 다시 섞기"):
-            st.session_state.order = random.sample(ids, len(ids))
-            st.session_state.index = 0
-            st.session_state.show_back = False
-
-        if not st.session_state.order or set(st.session_state.order) != set(ids):
-            st.session_state.order = random.sample(ids, len(ids))
-            st.session_state.index = 0
+            deck.shuffle()
             st.session_state.show_back = False
-
-        order = st.session_state.order
+        cid = deck.current_id
+    elif order_mode == DUE_ORDER_MODE:
+        # 덱이 바뀔 때만 힙을 새로 만들고, 이후에는 답할 때마다 해당 카드만 다시 넣는다.
+        if st.session_state.due_queue is None or st.session_state.get("due_queue_deck") is not deck:
+            st.session_state.due_queue = DueQueue(deck.order, st.session_state.schedule_map)
+            st.session_state.due_queue_deck = deck
+        cid = st.session_state.due_queue.peek(time.time())
+        if cid is None:
+            next_ts = st.session_state.due_queue.next_due_at()
+            next_msg = f" 다음 복습: {datetime.fromtimestamp(next_ts, KST):%m/%d %H:%M}" if next_ts else ""
+            st.success("🎉 지금 복습할 카드가 없습니다." + next_msg)
+            st.stop()
     else:
-        order = ids
-        st.session_state.order = []
+        cid = deck.current_id
 
-    st.session_state.index = st.session_state.index % max(len(order), 1)
+    jump_to = st.session_state.pop("study_jump_to", None)
+    if jump_to is not None and order_mode != DUE_ORDER_MODE and deck.jump(jump_to):
+        st.session_state.show_back = False
+        cid = deck.current_id
 
-    cid = order[st.session_state.index % len(order)]
-    try:
-        card = next(c for c in base if c["id"] == cid)
-    except StopIteration:
-        st.session_state.index = 0
+    card = deck.card(cid)
+    if card is None:
+        st.session_state.study_deck = None
         st.session_state.show_back = False
-        st.session_state.order = []
         st.rerun()
 
-    if recall_mode:
-        first_label, second_label = "설명", "개념"
-        first_text, second_text = card.get("back") or "", card.get("front") or ""
-        first_img, second_img = card.get("back_image_url"), card.get("front_image_url")
+    if fast_flip:
+        render_flip_window(deck, recall_mode, enter_only)
     else:
-        first_label, second_label = "문제", "정답"
-        first_text, second_text = card.get("front") or "", card.get("back") or ""
-        first_img, second_img = card.get("front_image_url"), card.get("back_image_url")
-
-    label = second_label if st.session_state.show_back else first_label
-    text = second_text if st.session_state.show_back else first_text
-    img = second_img if st.session_state.show_back else first_img
-
-    safe_text = render_safe_text(text)
-    # 뒷면 텍스트가 비어 있는 PDF 카드는 빈 텍스트 영역 자체를 만들지 않는다.
-    # 따라서 답안 이미지만 있을 때 이미지가 불필요하게 아래로 밀리지 않는다.
-    text_html = (
-        f'<div class="flashcard-text">{safe_text}</div>'
-        if (text or "").strip()
-        else ""
-    )
-
-    wc = _learner_wrong(card["id"])
-    pct = int(round((st.session_state.index + 1) / max(len(order), 1) * 100))
-    st.markdown(
-        f'<div class="progress-meta">{st.session_state.index + 1} / {len(order)}'
-        f' · 나의 오답 {wc}회</div>'
-        f'<div class="progress-bar-wrap"><div class="progress-bar-fill" style="width:{pct}%"></div></div>',
-        unsafe_allow_html=True
-    )
-
-    image_html = ""
-    if img:
-        safe_img_url = html.escape(str(img), quote=True)
-        image_html = (
-            f'<img src="{safe_img_url}" '
-            f'class="flashcard-image" alt="암기카드 이미지">'
+        # 지금 카드와 바로 다음 몇 장의 뒷면/이미지를 한 번에 받아 넘길 때마다 요청하지 않게 한다.
+        _upcoming = deck.upcoming(STUDY_HYDRATE_AHEAD - 1) if order_mode != DUE_ORDER_MODE else []
+        hydrate_cards([cid] + _upcoming)
+        card = full_card(card)
+        if st.session_state.offline and card_store().detail(card["id"]) is None:
+            st.caption("📴 이 카드의 뒷면/이미지는 오프라인 스냅샷에 없어 앞면만 보입니다.")
+
+        if recall_mode:
+            first_label, second_label = "설명", "개념"
+            first_text, second_text = card.get("back") or "", card.get("front") or ""
+            first_img, second_img = card.get("back_image_url"), card.get("front_image_url")
+        else:
+            first_label, second_label = "문제", "정답"
+            first_text, second_text = card.get("front") or "", card.get("back") or ""
+            first_img, second_img = card.get("front_image_url"), card.get("back_image_url")
+
+        label = second_label if st.session_state.show_back else first_label
+        text = second_text if st.session_state.show_back else first_text
+        img = second_img if st.session_state.show_back else first_img
+
+        wc = _learner_wrong(card["id"])
+        if order_mode == DUE_ORDER_MODE:
+            sched = st.session_state.schedule_map.get(card["id"])
+            interval = f"간격 {sched['interval_days']:g}일" if sched else "새 카드"
+            position, pct = f"⏰ 복습 · {interval}", 100
+        else:
+            position = f"{deck.position + 1} / {len(deck)}"
+            pct = int(round((deck.position + 1) / len(deck) * 100))
+        st.markdown(
+            f'<div class="progress-meta">{position}'
+            f' · 나의 오답 {wc}회</div>'
+            f'<div class="progress-bar-wrap"><div class="progress-bar-fill" style="width:{pct}%"></div></div>',
+            unsafe_allow_html=True
         )
 
-    card_html = (
-        '<div class="flashcard">'
-        f'<div class="flashcard-label">{html.escape(label)}</div>'
-        f'{text_html}'
-        f'{image_html}'
-        '</div>'
-    )
+        side = "second" if st.session_state.show_back else "first"
+        card_html = card_fragments().get(
+            (card["id"], side, recall_mode), (label, text, img),
+            lambda: render_card_html(label, text, img),
+        ) + render_image_prefetch(
+            study_prefetch_urls(deck, card, recall_mode, st.session_state.show_back, _upcoming)
+        )
 
-    st.markdown(card_html, unsafe_allow_html=True)
+        st.markdown(card_html, unsafe_allow_html=True)
 
-    if enter_only:
-        st.caption("⌨️ Enter 키를 눌러 진행합니다")
-        if st.button("▶️ 다음 (Enter 대체)", use_container_width=True):
+        if enter_only:
+            st.caption("⌨️ Enter 키를 눌러 진행합니다")
+            if st.button("▶️ 다음 (Enter 대체)", use_container_width=True):
+                if not st.session_state.show_back:
+                    st.session_state.show_back = True
+                else:
+                    mark_reviewed(card["id"])
+                    st.session_state.show_back = False
+                    deck.advance()
+        else:
             if not st.session_state.show_back:
-                st.session_state.show_back = True
+                if st.button("정답 보기", use_container_width=True):
+                    st.session_state.show_back = True
             else:
-                _mark_reviewed(card["id"])
-                st.session_state.show_back = False
-                st.session_state.index += 1
-    else:
-        if not st.session_state.show_back:
-            if st.button("정답 보기", use_container_width=True):
-                st.session_state.show_back = True
-        else:
-            cc1, cc2 = st.columns(2)
-            with cc1:
-                if st.button("✅ 정답"):
-                    _mark_reviewed(card["id"])
+                cc1, cc2 = st.columns(2)
+                with cc1:
+                    if st.button("✅ 정답"):
+                        mark_reviewed(card["id"])
+                        st.session_state.show_back = False
+                        deck.advance()
+                with cc2:
+                    if st.button("❌ 오답"):
+                        mark_reviewed(card["id"], mark_wrong=True)
+                        st.session_state.show_back = False
+                        deck.advance()
+
+                if st.button("🧹 이 카드 오답 제외"):
+                    discard_pending_progress(st.session_state.learner, [card["id"]])
+                    reset_progress(st.session_state.learner, [card["id"]])
+                    st.session_state.progress_map.discard(card["id"])
+                    st.session_state.schedule_map.pop(card["id"], None)
+                    st.session_state.due_queue = None
+                    deck.stale = True
                     st.session_state.show_back = False
-                    st.session_state.index += 1
-            with cc2:
-                if st.button("❌ 오답"):
-                    _mark_reviewed(card["id"], mark_wrong=True)
-                    st.session_state.show_back = False
-                    st.session_state.index += 1
+                    st.rerun()
 
-            if st.button("🧹 이 카드 오답 제외"):
-                reset_progress(st.session_state.learner, [card["id"]])
-                st.session_state.progress_map.pop(card["id"], None)
-                st.session_state.show_back = False
-                st.rerun()
+    if st.session_state.progress_pending:
+        _progress_flush_timer()
 
     if wrong_only:
         if st.button("🧹 이 카테고리 오답 전체 리셋"):
-            cat_ids = [c["id"] for c in cards if c.get("category") == cat and c.get("id") is not None]
-            reset_progress(st.session_state.learner, cat_ids)
+            cat_ids = [c["id"] for c in cards.in_category(cat) if c.get("id") is not None]
+            discard_pending_progress(st.session_state.learner, cat_ids)
+            reset_progress(st.session_state.learner, cat_ids, category=cat)
             for cid2 in cat_ids:
-                st.session_state.progress_map.pop(cid2, None)
+                st.session_state.progress_map.discard(cid2)
+                st.session_state.schedule_map.pop(cid2, None)
+            st.session_state.due_queue = None
+            deck.stale = True
             st.success("이 카테고리에서 나의 오답 기록이 모두 초기화되었습니다.")
             st.rerun()
 
@@ -1595,14 +4517,27 @@ elif page == "🛠️ 카드 관리":
         st.warning("카테고리가 없습니다. 카드 입력에서 카테고리를 먼저 추가하세요.")
         st.stop()
 
-    cat = st.selectbox("카테고리", cat_list)
-    cards = [c for c in st.session_state.cards if c.get("category") == cat]
+    def _pick_manage_card(card_id):
+        card_row = st.session_state.cards.get(card_id)
+        if card_row is not None:
+            st.session_state.manage_category = card_row.get("category")
+            st.session_state.manage_card = card_row
+
+    with st.expander("🌐 전체 카테고리에서 찾기"):
+        render_search_everywhere("manage_search_all_q", st.session_state.cards, "✏️ 편집", _pick_manage_card)
+
+    cat = st.selectbox("카테고리", cat_list, key="manage_category")
+    cards = st.session_state.cards.in_category(cat)
 
     if not cards:
         st.info("이 카테고리에 카드가 없습니다.")
         st.stop()
 
-    card = st.selectbox("카드 선택", cards, format_func=lambda c: (c.get("front") or "(앞면 없음)"))
+    card = st.selectbox(
+        "카드 선택", cards, format_func=lambda c: (c.get("front") or "(앞면 없음)"), key="manage_card"
+    )
+    hydrate_cards([card["id"]])
+    card = full_card(card)
 
     st.markdown("### 🖼️ 현재 등록된 이미지")
     p1, p2 = st.columns(2)
@@ -1631,7 +4566,7 @@ elif page == "🛠️ 카드 관리":
             uploaded_back = upload_image(back_file, "back") if back_file else None
             front_img = uploaded_front or old_front
             back_img = uploaded_back or old_back
-            ok = update_card(card["id"], new_cat, new_front, new_back, front_img, back_img)
+            ok = update_card(card["id"], new_cat, new_front, new_back, front_img, back_img) is not None
             if ok:
                 replaced_old = []
                 if uploaded_front and old_front and uploaded_front != old_front:
@@ -1642,7 +4577,7 @@ elif page == "🛠️ 카드 관리":
                     archive_ok, _ = _archive_image_paths(replaced_old)
                     if not archive_ok:
                         st.warning("⚠️ 수정은 완료됐지만 교체 전 이미지 일부를 휴지통으로 옮기지 못했습니다.")
-                sync()
+                show_local_cards()
                 st.success("수정 완료")
             else:
                 # DB 수정 실패 시 새로 업로드한 파일만 제거해 고아 파일을 남기지 않는다.
@@ -1655,9 +4590,8 @@ elif page == "🛠️ 카드 관리":
 
     with c2:
         if st.button("🗑️ 삭제"):
-            ok = delete_card(card["id"])
-            if ok:
-                sync()
+            if delete_card(card["id"]) is not None:
+                show_local_cards()
                 st.success("삭제 완료")
 
     st.markdown("---")
@@ -1689,9 +4623,8 @@ elif page == "🛠️ 카드 관리":
                 st.stop()
 
             manual_backup_now()
-            ok = merge_category(target_cat, to_cat)
-            if ok:
-                sync()
+            if merge_category(target_cat, to_cat) is not None:
+                show_local_cards()
                 st.success(f"병합 완료: '{target_cat}' → '{to_cat}'")
                 st.rerun()
 
@@ -1718,9 +4651,8 @@ elif page == "🛠️ 카드 관리":
                 st.stop()
 
             manual_backup_now()
-            ok = delete_category(target_cat)
-            if ok:
-                sync()
+            if delete_category(target_cat) is not None:
+                show_local_cards()
                 st.success(f"삭제 완료: '{target_cat}' 카테고리의 카드가 모두 삭제되었습니다.")
                 st.rerun()
 
@@ -1794,6 +4726,57 @@ elif page == "🛠️ 카드 관리":
                             st.caption("이동 위치")
                             st.code("\n".join(f"{src}  →  {dst}" for src, dst in moved), language=None)
 
+    if is_admin_learner(st.session_state.learner):
+        st.markdown("---")
+        with st.expander("📈 Supabase 호출 진단 (관리자)", expanded=False):
+            metrics = call_metrics()
+            st.caption(
+                f"집계 시작: {metrics.started_at.astimezone(KST).strftime('%Y-%m-%d %H:%M:%S')} · "
+                "이 서버 프로세스의 모든 세션 합계입니다. 같은 함수의 호출 수가 카드 수만큼 늘면 반복 호출(N+1)을 의심하세요."
+            )
+            metric_rows = metrics.rows()
+            if metric_rows:
+                st.dataframe(
+                    [{k: v for k, v in r.items() if k != "histogram"} for r in metric_rows],
+                    use_container_width=True,
+                    hide_index=True,
+                )
+                hist_op = st.selectbox("지연 분포 보기", [r["operation"] for r in metric_rows], key="diag_hist_op")
+                st.bar_chart(next(r["histogram"] for r in metric_rows if r["operation"] == hist_op))
+            else:
+                st.info("아직 기록된 호출이 없습니다.")
+
+            st.markdown("#### 🧮 학습 기록 메모리")
+            session_progress = st.session_state.get("progress_map")
+            if session_progress is not None and len(session_progress):
+                st.caption(
+                    f"이 세션의 오답 기록 {len(session_progress)}장: "
+                    f"{session_progress.nbytes() / 1024:.1f} KB "
+                    f"(행 dict로 들고 있으면 {_row_dicts_nbytes(st.session_state.learner, session_progress) / 1024:.1f} KB)"
+                )
+            if st.button("📏 5만 장 기준 측정", key="diag_progress_bench"):
+                st.session_state.progress_bench = benchmark_progress_memory()
+            if st.session_state.get("progress_bench"):
+                b = st.session_state.progress_bench
+                st.caption(
+                    f"카드 {b['cards']:,}장: 배열 방식 {b['compact_bytes'] / 1048576:.2f} MB · "
+                    f"행 dict 방식 {b['row_dict_bytes'] / 1048576:.2f} MB · 약 {b['ratio']}배 절약"
+                )
+
+            d1, d2 = st.columns(2)
+            with d1:
+                st.download_button(
+                    "⬇️ JSON 내보내기",
+                    json.dumps(metrics.export(), ensure_ascii=False, indent=2),
+                    file_name=f"supabase_calls_{_backup_timestamp()}.json",
+                    mime="application/json",
+                    use_container_width=True,
+                )
+            with d2:
+                if st.button("🧽 집계 초기화", use_container_width=True):
+                    metrics.reset()
+                    st.rerun()
+
     st.markdown("---")
     with st.expander("♻️ 백업 복구 (전체 덮어쓰기)", expanded=False):
         st.caption("⚠️ 선택한 백업으로 DB의 카드와 학습자별 진행 기록(오답 횟수/마지막 학습일)이 모두 **전체 교체**됩니다. (현재 데이터는 삭제 후 백업 데이터로 복원)")
@@ -1840,7 +4823,7 @@ elif page == "🛠️ 카드 관리":
             with st.spinner("복구 중..."):
                 ok = restore_from_backup(selected)
             if ok:
-                sync()
+                sync(full=True)
                 st.success("✅ 복구 완료! (DB가 백업 상태로 교체되었습니다)")
                 st.rerun()
 
@@ -1924,6 +4907,7 @@ elif page == "📄 PDF 가져오기":
                 st.stop()
             progress = st.progress(0, text="저장 중...")
             saved, failed = 0, 0
+            inserted = []
             for n, c in enumerate(to_save, start=1):
                 back_url = upload_image_bytes(
                     c["back_image_bytes"], "back", f"pdf_{c['src_pages'][0]}_{c['src_pages'][1]}.png"
@@ -1934,14 +4918,17 @@ elif page == "📄 PDF 가져오기":
                 else:
                     # PDF 카드는 답이 이미지에 있으므로 back 텍스트는 빈 문자열로 저장한다.
                     # 화면에서는 빈 텍스트 영역을 렌더링하지 않아 이미지가 위쪽에 표시된다.
-                    ok = insert_card(
+                    rows = insert_card(
                         c["category"],
                         c["front"],
                         "",
                         None,
                         back_url,
                         make_backup=False,
+                        apply_local=False,
                     )
+                    ok = rows is not None
+                    inserted.extend(rows or [])
 
                 if ok:
                     saved += 1
@@ -1957,10 +4944,81 @@ elif page == "📄 PDF 가져오기":
                                 pass
                 progress.progress(n / len(to_save), text=f"저장 중... ({n}/{len(to_save)})")
             progress.empty()
+            # 카드마다 스냅샷을 다시 만들지 않도록 저장한 행을 한 번에 반영한다.
+            if inserted:
+                card_store().apply_local(changed=inserted)
             if saved:
                 auto_backup()
-                clear_cards_cache()
             st.success(f"✅ {saved}개 저장 완료" + (f" · ⚠️ {failed}개 실패" if failed else ""))
             st.session_state.pdf_cards = None
-            sync()
+            show_local_cards()
             st.rerun()
+
+# =======================
+# 5️⃣ 학습 통계
+# - 일별 집계 카운터(flashcard_daily_stats)만 읽어 그린다. 이벤트 로그 전체를 훑지 않는다.
+# =======================
+elif page == "📊 학습 통계":
+    if not has_capability("daily_stats"):
+        st.info(
+            "학습 통계를 보려면 Supabase에 리뷰 이벤트 테이블과 일별 집계 테이블(트리거 포함)을 먼저 만들어야 합니다. "
+            "SQL은 app.py의 '📈 학습 통계' 주석에 있습니다."
+        )
+        st.stop()
+
+    sc1, sc2 = st.columns(2)
+    with sc1:
+        days = st.selectbox("기간", [7, 30, 90, 365], index=1, format_func=lambda d: f"최근 {d}일")
+    stats = fetch_daily_stats(st.session_state.learner, days)
+    if stats is None:
+        st.warning("⚠️ 학습 통계를 불러오지 못했습니다. (flashcard_daily_stats 테이블/네트워크 확인)")
+        st.stop()
+    if not stats:
+        st.info("이 기간에 기록된 학습이 없습니다. 암기 모드에서 ✅/❌로 학습하면 여기에 쌓입니다.")
+        st.stop()
+
+    stat_cats = sorted({r["category"] for r in stats})
+    with sc2:
+        stat_cat = st.selectbox("카테고리", ["전체"] + stat_cats, key="stats_category")
+    rows = stats if stat_cat == "전체" else [r for r in stats if r["category"] == stat_cat]
+
+    by_day = {}
+    for r in rows:
+        d = by_day.setdefault(r["day"], [0, 0])
+        d[0] += int(r.get("reviews") or 0)
+        d[1] += int(r.get("correct") or 0)
+    day_keys = sorted(by_day)
+    total_reviews = sum(v[0] for v in by_day.values())
+    total_correct = sum(v[1] for v in by_day.values())
+
+    m1, m2, m3 = st.columns(3)
+    m1.metric("학습 횟수", f"{total_reviews:,}")
+    m2.metric("정답률", f"{total_correct / total_reviews:.0%}" if total_reviews else "-")
+    m3.metric("학습한 날", f"{len(day_keys)}일")
+
+    st.markdown("#### 📅 일별 학습량")
+    st.bar_chart(
+        {"날짜": day_keys, "정답": [by_day[d][1] for d in day_keys], "오답": [by_day[d][0] - by_day[d][1] for d in day_keys]},
+        x="날짜", y=["정답", "오답"],
+    )
+    st.markdown("#### 🎯 일별 정답률 (%)")
+    st.line_chart(
+        {"날짜": day_keys, "정답률": [round(by_day[d][1] / by_day[d][0] * 100, 1) if by_day[d][0] else 0 for d in day_keys]},
+        x="날짜", y="정답률",
+    )
+
+    if stat_cat == "전체":
+        st.markdown("#### 🗂️ 카테고리별 정답률")
+        by_cat = {}
+        for r in stats:
+            c = by_cat.setdefault(r["category"] or "(없음)", [0, 0])
+            c[0] += int(r.get("reviews") or 0)
+            c[1] += int(r.get("correct") or 0)
+        st.dataframe(
+            [
+                {"카테고리": c, "학습 횟수": v[0], "정답": v[1], "정답률(%)": round(v[1] / v[0] * 100, 1) if v[0] else 0}
+                for c, v in sorted(by_cat.items(), key=lambda kv: -kv[1][0])
+            ],
+            use_container_width=True,
+            hide_index=True,
+        )